@@ -3,15 +3,19 @@ from fastapi.security import OAuth2PasswordRequestForm
 from starlette import status
 
 from app.api.authentication import services
+from app.api.authentication.hashing import HashingOverloaded, PasswordHasher
+from app.api.dependencies.auth import get_password_hasher
+from app.api.dependencies.cache import get_user_cache
 from app.api.dependencies.database import get_repository
+from app.cache import TTLCache
 from app.config import AppSettings, get_app_settings
+from app.db.errors import EntityAlreadyExists
 from app.db.repositories.user import UserRepository
 from app.db.schemas.token import Token
 from app.db.schemas.user import UserLogin, UserCreate, UserBase
 
 auth_router = APIRouter()
 
-
 @auth_router.post("/token",
                   name="auth:get-tokens",
                   status_code=status.HTTP_200_OK,
@@ -21,7 +25,8 @@ auth_router = APIRouter()
 async def handler_login_for_tokens(
         form_data: OAuth2PasswordRequestForm = Depends(),
         user_repo: UserRepository = Depends(get_repository(UserRepository)),
-        settings: AppSettings = Depends(get_app_settings)
+        settings: AppSettings = Depends(get_app_settings),
+        password_hasher: PasswordHasher = Depends(get_password_hasher)
 ) -> Token:
     """ Авторизация """
     wrong_unauthorized_error = HTTPException(
@@ -36,10 +41,19 @@ async def handler_login_for_tokens(
     if not user_db:
         raise wrong_unauthorized_error
     else:
-        if services.verify_password(
+        try:
+            is_valid_password = await services.verify_password(
                 plain_password=form_data.password,
-                hashed_password=user_db.password
-        ) is False:
+                hashed_password=user_db.password,
+                password_hasher=password_hasher
+            )
+        except HashingOverloaded:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again later",
+                headers={"Retry-After": "1"},
+            )
+        if is_valid_password is False:
             raise wrong_unauthorized_error
         else:
             return Token(
@@ -62,7 +76,8 @@ async def handler_login_for_tokens(
 async def handler_login(
         user_login: UserLogin,
         user_repo: UserRepository = Depends(get_repository(UserRepository)),
-        settings: AppSettings = Depends(get_app_settings)
+        settings: AppSettings = Depends(get_app_settings),
+        password_hasher: PasswordHasher = Depends(get_password_hasher)
 ) -> Token:
     """ Авторизация """
     wrong_unauthorized_error = HTTPException(
@@ -77,10 +92,19 @@ async def handler_login(
     if not user_db:
         raise wrong_unauthorized_error
     else:
-        if services.verify_password(
+        try:
+            is_valid_password = await services.verify_password(
                 plain_password=user_login.password,
-                hashed_password=user_db.password
-        ) is False:
+                hashed_password=user_db.password,
+                password_hasher=password_hasher
+            )
+        except HashingOverloaded:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again later",
+                headers={"Retry-After": "1"},
+            )
+        if is_valid_password is False:
             raise wrong_unauthorized_error
         else:
             return Token(
@@ -102,7 +126,9 @@ async def handler_login(
                   )
 async def handler_registration(
         user_create: UserCreate,
-        user_repo: UserRepository = Depends(get_repository(UserRepository))
+        user_repo: UserRepository = Depends(get_repository(UserRepository)),
+        user_cache: TTLCache = Depends(get_user_cache),
+        password_hasher: PasswordHasher = Depends(get_password_hasher)
 ) -> UserBase:
     """ Регистрация """
     user_db = await services.verify_username(
@@ -114,4 +140,22 @@ async def handler_registration(
             status_code=status.HTTP_409_CONFLICT,
             detail="Username already registered"
         )
-    return await services.registration_user(user=user_create, user_repo=user_repo)
+    try:
+        return await services.registration_user(
+            user=user_create,
+            user_repo=user_repo,
+            user_cache=user_cache,
+            password_hasher=password_hasher
+        )
+    except HashingOverloaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, try again later",
+            headers={"Retry-After": "1"},
+        )
+    except EntityAlreadyExists:
+        # тот же username успели зарегистрировать между проверкой и вставкой
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Username already registered"
+        )
@@ -0,0 +1,80 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable
+
+from app.profiling import timed
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+@lru_cache
+def get_pwd_context() -> "CryptContext":
+    """ passlib и bcrypt импортируются при первом хешировании, а не при старте приложения """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingOverloaded(Exception):
+    """ Возникает, когда очередь на хеширование паролей переполнена """
+
+
+def hash_password(password: str) -> str:
+    """ Хеширует пароль, выполняется в пуле исполнителей """
+    return get_pwd_context().hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    """ Проверяет пароль, выполняется в пуле исполнителей """
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Выполняет bcrypt в отдельном пуле потоков или процессов, не блокируя event loop.
+    Одновременно выполняется не больше max_workers операций, ещё max_queue_size ждут
+    в очереди, остальные сразу получают HashingOverloaded
+    """
+
+    def __init__(
+            self,
+            max_workers: int,
+            max_queue_size: int,
+            use_processes: bool = False
+    ) -> None:
+        self._executor: Executor
+        if use_processes:
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix="password-hasher"
+            )
+        self._max_pending = max_workers + max_queue_size
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """ Кол-во выполняющихся и ожидающих операций """
+        return self._pending
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self._max_pending:
+            raise HashingOverloaded("Password hashing queue is full")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with timed("hash"):
+                return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(check_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
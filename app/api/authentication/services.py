@@ -2,35 +2,65 @@ from datetime import datetime, timedelta
 from typing import Optional
 
 from jose import jwt
-from passlib.context import CryptContext
+from starlette.requests import Request
 
+from app.api.authentication.hashing import PasswordHasher
+from app.cache import TTLCache
 from app.config import AppSettings
+from app.db.connection import primary_reads
 from app.db.repositories.user import UserRepository
 from app.db.schemas.user import UserDB, UserCreate, UserBase
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 async def verify_username(
         username: str,
         user_repo: UserRepository
 ) -> UserDB | None:
-    """ Сервис для проверки пользователя по username """
-    return await user_repo.get_by_username(username=username)
+    """
+    Сервис для проверки пользователя по username. Читает с primary:
+    пользователь мог только что зарегистрироваться, а реплика ещё отстаёт
+    """
+    with primary_reads():
+        return await user_repo.get_by_username(username=username)
+
+
+async def get_cached_user(
+        username: str,
+        user_repo: UserRepository,
+        user_cache: TTLCache
+) -> UserBase | None:
+    """ Сервис получения пользователя по username, сначала из кэша процесса """
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    user_db = await user_repo.get_by_username(username=username)
+    if not user_db:
+        return None
+    user = UserBase(id=user_db.id, username=user_db.username)
+    user_cache.set(username, user)
+    return user
 
 
 async def registration_user(
         user: UserCreate,
-        user_repo: UserRepository
+        user_repo: UserRepository,
+        user_cache: TTLCache,
+        password_hasher: PasswordHasher
 ) -> UserBase:
     """ Сервис хеширования пароля пользователя для добавления в бд """
-    user.password = pwd_context.hash(user.password)
-    return await user_repo.add(user)
+    user.password = await password_hasher.hash(user.password)
+    user_db = await user_repo.add(user)
+    user_cache.invalidate(user_db.username)
+    return user_db
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def verify_password(
+        plain_password: str,
+        hashed_password: str,
+        password_hasher: PasswordHasher
+) -> bool:
     """ Сервис для проверки пароля """
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 def create_access_token(
@@ -84,6 +114,19 @@ def decode_access_token(token: str, settings: AppSettings):
     )
 
 
+def decode_request_token(request: Request, token: str, settings: AppSettings) -> dict:
+    """
+    Расшифровывает Access Token запроса один раз: выбор соединения с бд
+    и get_current_user берут результат из request.state
+    """
+    decoded = getattr(request.state, "access_token", None)
+    if decoded is not None and decoded[0] == token:
+        return decoded[1]
+    payload = decode_access_token(token=token, settings=settings)
+    request.state.access_token = (token, payload)
+    return payload
+
+
 def decode_refresh_token(token: str, settings: AppSettings):
     """Расшифровывает Refresh Token"""
     return jwt.decode(
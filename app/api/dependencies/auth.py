@@ -4,23 +4,38 @@ from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from starlette import status
+from starlette.requests import Request
 
 from app.api.authentication import services
+from app.api.authentication.hashing import PasswordHasher
+from app.api.dependencies.cache import get_user_cache
 from app.api.dependencies.database import get_repository
+from app.cache import TTLCache
 from app.config import AppSettings, get_app_settings
 from app.db.repositories.user import UserRepository
 from app.db.schemas.user import UserBase
 from app.logging.logger import logger
+from app.profiling import timed
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"/api/v1/auth/token")
 
 
+def get_password_hasher(request: Request) -> PasswordHasher:
+    """ Пул для хеширования паролей """
+    return request.app.state.password_hasher
+
+
 async def get_current_user(
+        request: Request,
         token: str = Depends(oauth2_scheme),
         user_repo: UserRepository = Depends(get_repository(UserRepository)),
-        settings: AppSettings = Depends(get_app_settings)
+        settings: AppSettings = Depends(get_app_settings),
+        user_cache: TTLCache = Depends(get_user_cache)
 ) -> UserBase:
-    """ Проверяет авторизован ли пользователь """
+    """
+    Проверяет авторизован ли пользователь. Пользователь сохраняется в request.state,
+    по нему ReadYourWritesMiddleware закрепляет чтения автора изменений за primary
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -28,8 +43,9 @@ async def get_current_user(
     )
     if token:
         try:
-            payload = services.decode_access_token(
-                token=token, settings=settings)
+            with timed("auth"):
+                payload = services.decode_request_token(
+                    request=request, token=token, settings=settings)
             token_validity = payload.get("exp")
             if datetime.timestamp(datetime.utcnow()) >= token_validity:
                 raise HTTPException(
@@ -43,10 +59,15 @@ async def get_current_user(
         except jwt.JWTError as e:
             logger.exception(e)
             raise credentials_exception
-        user = await user_repo.get_by_username(username=username)
+        user = await services.get_cached_user(
+            username=username,
+            user_repo=user_repo,
+            user_cache=user_cache
+        )
         if not user:
             raise credentials_exception
-        return UserBase(id=user.id, username=user.username)
+        request.state.user = user
+        return user
     else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
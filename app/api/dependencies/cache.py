@@ -0,0 +1,19 @@
+from starlette.requests import Request
+
+from app.api.posts.cache import PostCache
+from app.cache import TTLCache
+
+
+def get_user_cache(request: Request) -> TTLCache:
+    """ Кэш пользователей процесса, ключ - username """
+    return request.app.state.user_cache
+
+
+def get_recent_writers(request: Request) -> TTLCache:
+    """ Пользователи, которые недавно что-то записали, ключ - username """
+    return request.app.state.recent_writers
+
+
+def get_post_cache(request: Request) -> PostCache:
+    """ Кэш готовых ответов с постами процесса, ключ - id поста """
+    return request.app.state.post_cache
@@ -1,31 +1,70 @@
-from typing import Callable, Type, AsyncGenerator
+from typing import Callable, Type
 
-from asyncpg.connection import Connection
 from asyncpg.pool import Pool
 from fastapi import Depends
+from jose import jwt
 from starlette.requests import Request
 
-from app.db.repositories.base import BaseRepository
+from app.api.authentication.services import decode_request_token
+from app.api.dependencies.cache import get_recent_writers
+from app.api.middleware import is_pinned_to_primary
+from app.cache import TTLCache
+from app.config import AppSettings, get_app_settings
+from app.db.connection import LazyConnection, ReadPools
+from app.db.repositories.base import BaseRepository, IdentityMap
 
 
 def _get_db_pool(request: Request) -> Pool:
     return request.app.state.pool
 
 
-async def _get_connection_from_pool(
+def _get_read_pools(request: Request) -> ReadPools:
+    return request.app.state.read_pools
+
+
+def _wrote_recently(request: Request, recent_writers: TTLCache, settings: AppSettings) -> bool:
+    """ True если пользователь из токена запроса недавно что-то записал """
+    if not len(recent_writers):
+        return False
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        username = decode_request_token(request=request, token=token, settings=settings).get("username")
+    except jwt.JWTError:
+        return False
+    return username is not None and recent_writers.get(username) is not None
+
+
+def _get_connection_from_pool(
+    request: Request,
     pool: Pool = Depends(_get_db_pool),
-) -> AsyncGenerator[Connection, None]:
-    async with pool.acquire() as conn:
-        yield conn
+    read_pools: ReadPools = Depends(_get_read_pools),
+    recent_writers: TTLCache = Depends(get_recent_writers),
+    settings: AppSettings = Depends(get_app_settings),
+) -> LazyConnection:
+    """
+    Соединение берётся из пула при первом запросе к бд, а не на весь HTTP-запрос.
+    Клиент или пользователь, который недавно что-то записал, читает только с primary
+    """
+    if not read_pools or is_pinned_to_primary(request, settings) or _wrote_recently(request, recent_writers, settings):
+        return LazyConnection(pool)
+    return LazyConnection(pool, read_pools)
+
+
+def _get_identity_map() -> IdentityMap:
+    """ Один экземпляр на запрос: FastAPI кэширует результат зависимости """
+    return IdentityMap()
 
 
 def get_repository(
     repo_type: Type[BaseRepository],
-) -> Callable[[Connection], BaseRepository]:
+) -> Callable[[LazyConnection, IdentityMap], BaseRepository]:
     def _get_repo(
-        conn: Connection = Depends(_get_connection_from_pool),
+        conn: LazyConnection = Depends(_get_connection_from_pool),
+        identity_map: IdentityMap = Depends(_get_identity_map),
     ) -> BaseRepository:
-        return repo_type(conn)
+        return repo_type(conn, identity_map)
 
     return _get_repo
 
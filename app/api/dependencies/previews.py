@@ -0,0 +1,13 @@
+from starlette.requests import Request
+
+from app.api.posts.previews import PreviewFetcher, PreviewWorker
+
+
+def get_preview_fetcher(request: Request) -> PreviewFetcher:
+    """ Получение preview по ссылке с общей HTTP-сессией и кэшем """
+    return request.app.state.preview_fetcher
+
+
+def get_preview_worker(request: Request) -> PreviewWorker:
+    """ Фоновый пул получения preview """
+    return request.app.state.preview_worker
@@ -0,0 +1,8 @@
+from starlette.requests import Request
+
+from app.storage.media import MediaStorage
+
+
+def get_media_storage(request: Request) -> MediaStorage:
+    """ Хранилище media файлов """
+    return request.app.state.media_storage
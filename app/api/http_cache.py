@@ -0,0 +1,74 @@
+"""
+Условные GET запросы для ответов с постами: ETag по версиям постов,
+Last-Modified по времени изменения поста (только для одного поста) и ответ 304 без тела
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.db.schemas.post import ListOfPostsInResponse, Post
+
+
+def post_etag(post: Post) -> str:
+    """ Сильный ETag поста, меняется вместе с его версией """
+    return f'"{post.id}-{post._version}"'
+
+
+def posts_etag(posts: ListOfPostsInResponse) -> str:
+    """ Сильный ETag страницы постов по их id, версиям и курсорам соседних страниц """
+    digest = hashlib.blake2b(digest_size=16)
+    for post in posts.posts:
+        digest.update(f"{post.id}-{post._version};".encode())
+    digest.update(f"{posts.next_cursor};{posts.prev_cursor}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def cache_headers(etag: str, last_modified: datetime | None, cache_control: str) -> dict[str, str]:
+    """ Заголовки валидаторов кэша для ответа и для 304 """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def post_headers(post: Post, cache_control: str) -> dict[str, str]:
+    return cache_headers(post_etag(post), post._updated_at, cache_control)
+
+
+def posts_headers(posts: ListOfPostsInResponse, cache_control: str) -> dict[str, str]:
+    """
+    Заголовки страницы постов только с ETag: страница меняется и без изменения
+    её постов (удаление или добавление поста сдвигает страницу), время изменения
+    постов этого не отражает, поэтому If-Modified-Since для списков не проверяется
+    """
+    return cache_headers(posts_etag(posts), None, cache_control)
+
+
+def is_not_modified(request: Request, headers: dict[str, str]) -> bool:
+    """
+    True если у клиента актуальная версия ответа.
+    If-None-Match сравнивается со слабой семантикой и имеет приоритет над If-Modified-Since,
+    который проверяется только для ответов с Last-Modified
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return headers["ETag"] in etags
+    if_modified_since = request.headers.get("if-modified-since")
+    last_modified = headers.get("Last-Modified")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
@@ -0,0 +1,51 @@
+from fastapi import APIRouter
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import metrics
+
+metrics_router = APIRouter()
+
+# starlette сам добавляет charset=utf-8 к текстовым типам
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _update_gauges(request: Request) -> None:
+    """ Значения, которые берутся из состояния приложения в момент запроса метрик: пулы, очереди и кэши """
+    state = request.app.state
+    metrics.db_pool_size.set(state.pool.get_size(), "primary")
+    metrics.db_pool_idle.set(state.pool.get_idle_size(), "primary")
+    if state.read_pools:
+        metrics.db_pool_size.set(sum(pool.get_size() for pool in state.read_pools.pools), "replica")
+        metrics.db_pool_idle.set(sum(pool.get_idle_size() for pool in state.read_pools.pools), "replica")
+    metrics.background_queue_depth.set(state.preview_worker.queue_depth, "preview")
+    metrics.background_queue_depth.set(state.password_hasher.pending, "password_hashing")
+    caches = {
+        "posts": state.post_cache.cache,
+        "users": state.user_cache,
+        "previews": state.preview_fetcher.cache,
+    }
+    for name, cache in caches.items():
+        metrics.cache_entries.set(len(cache), name)
+        metrics.cache_hits.set_total(cache.hits, name)
+        metrics.cache_misses.set_total(cache.misses, name)
+        metrics.cache_evictions.set_total(cache.evictions, name)
+    metrics.post_cache_coalesced.set_total(state.post_cache.coalesced)
+    metrics.post_cache_invalidations.set_total(state.post_cache.invalidations)
+    metrics.post_cache_listening.set(int(state.post_cache.listening))
+
+
+@metrics_router.get(
+    "/metrics",
+    name="metrics",
+    status_code=status.HTTP_200_OK
+)
+async def handler_metrics(request: Request) -> Response:
+    """
+    Метрики этого воркера в текстовом формате Prometheus. Воркеры, запущенные
+    uvicorn --workers на одном порту, отвечают по очереди, поэтому метрики собираются
+    с каждого воркера по отдельному адресу
+    """
+    _update_gauges(request)
+    return Response(content=metrics.registry.render(), media_type=CONTENT_TYPE)
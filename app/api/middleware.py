@@ -0,0 +1,158 @@
+import hashlib
+import hmac
+import random
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import metrics
+from app.config import AppSettings
+from app.logging.logger import logger
+from app.profiling import start_profile, stop_profile
+
+# время, до которого чтения клиента идут на primary (unix time), и его подпись
+PRIMARY_COOKIE = "db_primary_until"
+
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def primary_cookie_value(until: float, secret_key: str) -> str:
+    """ Значение cookie: время окончания закрепления и его HMAC, чтобы клиент не мог продлить срок """
+    timestamp = f"{until:.0f}"
+    return f"{timestamp}.{_sign(timestamp, secret_key)}"
+
+
+def is_pinned_to_primary(request: Request, settings: AppSettings) -> bool:
+    """
+    True если клиент недавно что-то записал и должен читать с primary.
+    Cookie без верной подписи или со сроком дальше окна read_your_writes_seconds не учитывается
+    """
+    value = request.cookies.get(PRIMARY_COOKIE)
+    if value is None:
+        return False
+    timestamp, _, signature = value.partition(".")
+    if not hmac.compare_digest(signature, _sign(timestamp, settings.access_secret_key.get_secret_value())):
+        return False
+    try:
+        remaining = float(timestamp) - time.time()
+    except ValueError:
+        return False
+    # время в cookie округлено до секунды
+    return 0 < remaining <= settings.read_your_writes_seconds + 1
+
+
+def _sign(timestamp: str, secret_key: str) -> str:
+    return hmac.new(secret_key.encode(), timestamp.encode(), hashlib.sha256).hexdigest()
+
+
+class ReadYourWritesMiddleware:
+    """
+    После успешного изменяющего запроса ставит cookie, по которой следующие
+    window_seconds секунд чтения клиента выполняются на primary, а не на реплике,
+    где его запись может ещё не появиться. Автор запроса, если он авторизован,
+    попадает в app.state.recent_writers, и с primary читают все его клиенты, в том числе без cookie.
+    Запросы к exclude_paths (вход и регистрация) клиента не закрепляют, cookie подписывается secret_key
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            window_seconds: int,
+            secret_key: str,
+            exclude_paths: tuple[str, ...] = ()
+    ) -> None:
+        self.app = app
+        self.window_seconds = window_seconds
+        self.secret_key = secret_key
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] in _SAFE_METHODS
+            or scope["path"].startswith(self.exclude_paths)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.window_seconds
+                # пользователя кладёт в request.state зависимость get_current_user
+                user = scope.get("state", {}).get("user")
+                if user is not None:
+                    scope["app"].state.recent_writers.set(user.username, True)
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "set-cookie",
+                    f"{PRIMARY_COOKIE}={primary_cookie_value(until, self.secret_key)}; Max-Age={self.window_seconds}; Path=/; HttpOnly; SameSite=Lax"
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует долю sample_rate запросов: добавляет к ответу заголовок Server-Timing
+    со временем фаз обработки и пишет в лог запросы дольше slow_request_ms с разбивкой по фазам
+    """
+
+    def __init__(self, app: ASGIApp, sample_rate: float, slow_request_ms: int) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        profile, token = start_profile()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("server-timing", profile.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            stop_profile(token)
+            if profile.elapsed() * 1000 >= self.slow_request_ms:
+                logger.warning(f"Медленный запрос {scope['method']} {scope['path']}: {profile.breakdown()}")
+
+
+class MetricsMiddleware:
+    """
+    Длительность запросов по методу, шаблону маршрута и статусу ответа.
+    Шаблон берётся из маршрута, который FastAPI записывает в scope,
+    запросы без подходящего маршрута попадают в route="unmatched"
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            metrics.http_request_duration.observe(
+                time.perf_counter() - started, scope["method"], route, str(status_code)
+            )
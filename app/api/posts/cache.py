@@ -0,0 +1,140 @@
+import asyncio
+from dataclasses import dataclass
+
+import asyncpg
+from asyncpg.connection import Connection
+from fastapi.responses import JSONResponse
+
+from app.api import http_cache
+from app.api.responses import FastJSONResponse, post_content, validated_post_content
+from app.cache import SingleFlight, TTLCache
+from app.config import AppSettings
+from app.db.connection import open_dedicated_connection, primary_reads
+from app.db.repositories.post import PostRepository
+from app.logging.logger import logger
+from app.profiling import timed
+
+# канал, в который триггер posts_notify_invalidated пишет id изменённого поста
+INVALIDATION_CHANNEL = "post_invalidated"
+_MAX_RECONNECT_DELAY_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class RenderedPost:
+    """ Готовое тело ответа с постом и заголовки кэширования к нему """
+    body: bytes
+    headers: dict[str, str]
+
+
+class PostCache:
+    """
+    Кэш готовых ответов GET /posts/{id} в пределах одного воркера.
+    Одновременные промахи по одному посту выполняются одним запросом к бд.
+    Запись удаляется, когда пост меняет этот воркер, и по уведомлению из канала
+    post_invalidated, которое триггер на posts рассылает всем воркерам.
+    Пока соединение LISTEN не установлено, ответы не кэшируются
+    """
+
+    def __init__(self, cache: TTLCache, settings: AppSettings) -> None:
+        self.cache = cache
+        self.settings = settings
+        self.coalesced = 0
+        self.invalidations = 0
+        self._in_flight = SingleFlight()
+        # поколение поста, который сейчас загружается: растёт при каждом его изменении
+        self._generations: dict[int, int] = {}
+        # поколение всего кэша: растёт, когда уведомления могли потеряться
+        self._epoch = 0
+        self._conn: Connection | None = None
+        self._reconnect_task: asyncio.Task | None = None
+        self._closed = False
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None
+
+    async def get(self, post_id: int, post_repo: PostRepository) -> RenderedPost:
+        """ Готовый ответ с постом, EntityDoesNotExist если поста нет """
+        rendered = self.cache.get(post_id)
+        if rendered is not None:
+            return rendered
+        rendered, shared = await self._in_flight.do(
+            post_id, lambda: self._load(post_id=post_id, post_repo=post_repo)
+        )
+        if shared:
+            self.coalesced += 1
+        return rendered
+
+    def invalidate(self, post_id: int) -> None:
+        """ Удаляет пост из кэша, загружаемый в этот момент ответ с ним не будет сохранён """
+        if post_id in self._generations:
+            self._generations[post_id] += 1
+        self.invalidations += 1
+        self.cache.invalidate(post_id)
+
+    async def listen(self) -> None:
+        """ Подписывается на уведомления об изменении постов """
+        conn = await open_dedicated_connection(self.settings)
+        await conn.add_listener(INVALIDATION_CHANNEL, self._on_notification)
+        conn.add_termination_listener(self._on_connection_lost)
+        self._conn = conn
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            await asyncio.gather(self._reconnect_task, return_exceptions=True)
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    async def _load(self, post_id: int, post_repo: PostRepository) -> RenderedPost:
+        # загрузки одного поста объединяются SingleFlight, поэтому поколение у поста одно
+        epoch = self._epoch
+        self._generations[post_id] = 0
+        try:
+            # ответ живёт в кэше до уведомления об изменении, поэтому читается с primary без отставания реплики
+            with primary_reads():
+                post = await post_repo.get_by_id(post_id=post_id)
+            with timed("serialize"):
+                if self.settings.posts_serialization == "fast":
+                    body = FastJSONResponse(post_content(post)).body
+                else:
+                    body = JSONResponse(validated_post_content(post)).body
+                rendered = RenderedPost(
+                    body=body,
+                    headers=http_cache.post_headers(post, self.settings.posts_cache_control)
+                )
+        finally:
+            changed = self._generations.pop(post_id) > 0
+        # пока шёл запрос, пост мог измениться - такой ответ отдаётся, но не кэшируется
+        if not changed and epoch == self._epoch and self.listening:
+            self.cache.set(post_id, rendered)
+        return rendered
+
+    def _on_notification(self, conn: Connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            post_id = int(payload)
+        except ValueError:
+            logger.warning(f"Неожиданное уведомление {channel}: {payload!r}")
+            return
+        self.invalidate(post_id)
+
+    def _on_connection_lost(self, conn: Connection) -> None:
+        # уведомления могли потеряться, поэтому закэшированным ответам больше нельзя доверять
+        self._conn = None
+        self._epoch += 1
+        self.cache.clear()
+        if not self._closed:
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = 1
+        while not self._closed:
+            await asyncio.sleep(delay)
+            try:
+                await self.listen()
+                return
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning(f"Не удалось подписаться на {INVALIDATION_CHANNEL}: {e}")
+                delay = min(delay * 2, _MAX_RECONNECT_DELAY_SECONDS)
@@ -5,19 +5,39 @@ from fastapi import (
     UploadFile,
     File,
     Body,
-    Response,
-    BackgroundTasks
+    Path,
+    Request,
+    Response
 )
 from starlette import status
 
+from app.api import http_cache
+
 from app.api.dependencies.auth import get_current_user
+from app.api.dependencies.cache import get_post_cache
 from app.api.dependencies.database import get_repository
 from app.api.dependencies.posts import check_post_modification_permissions, get_post_by_id_from_path
+from app.api.dependencies.previews import get_preview_fetcher, get_preview_worker
+from app.api.dependencies.storage import get_media_storage
 from app.api.posts import services
-from app.api.posts.services import save_files, get_content_by_link
+from app.api.posts.cache import PostCache
+from app.api.posts.previews import PENDING_PREVIEW, PreviewFetcher, PreviewWorker
+from app.api.posts.services import save_files
+from app.api.responses import FastJSONResponse, posts_content
+from app.config import AppSettings, get_app_settings
+from app.db.errors import EntityDoesNotExist
+from app.db.repositories.media import MediaRepository
 from app.db.repositories.post import PostRepository
-from app.db.schemas.post import PostCreate, Post, PostLikeCount, ListOfPostsInResponse
+from app.db.schemas.post import (
+    PostCreate,
+    Post,
+    PostLikeCount,
+    ListOfPostsInResponse,
+    PaginationDirection
+)
 from app.db.schemas.user import UserBase
+from app.profiling import timed
+from app.storage.media import MediaStorage, MediaTooLarge
 
 post_router = APIRouter()
 
@@ -29,16 +49,43 @@ post_router = APIRouter()
     response_model=ListOfPostsInResponse
 )
 async def handler_get_all_posts(
+        request: Request,
+        response: Response,
         page: int = 0,
         limit: int = 5,
-        post_repo: PostRepository = Depends(get_repository(PostRepository))
-) -> ListOfPostsInResponse:
-    """ Возвращает список постов блога с постраничной навигацией"""
-    return await services.get_all_posts(
-        page=page,
-        limit=limit,
-        post_repo=post_repo
-    )
+        cursor: str | None = None,
+        direction: PaginationDirection = PaginationDirection.after,
+        post_repo: PostRepository = Depends(get_repository(PostRepository)),
+        settings: AppSettings = Depends(get_app_settings)
+) -> ListOfPostsInResponse | Response:
+    """
+    Возвращает список постов блога, новые первыми.
+    Поддерживает курсорную навигацию: next_cursor из ответа передаётся как cursor
+    с direction=after и листает к более старым постам, prev_cursor с direction=before - к более новым.
+    Параметр page оставлен для совместимости.
+    Ответ содержит ETag, при совпадении If-None-Match возвращается 304
+    """
+    try:
+        posts = await services.get_all_posts(
+            page=page,
+            limit=limit,
+            cursor=cursor,
+            direction=direction,
+            post_repo=post_repo
+        )
+    except services.InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    headers = http_cache.posts_headers(posts, settings.posts_cache_control)
+    if http_cache.is_not_modified(request, headers):
+        return http_cache.not_modified(headers)
+    if settings.posts_serialization == "fast":
+        with timed("serialize"):
+            return FastJSONResponse(posts_content(posts), headers=headers)
+    response.headers.update(headers)
+    return posts
 
 
 @post_router.get(
@@ -48,13 +95,26 @@ async def handler_get_all_posts(
     response_model=Post
 )
 async def handler_get_post(
-        post: Post = Depends(get_post_by_id_from_path),
-        post_repo: PostRepository = Depends(get_repository(PostRepository))
-) -> Post:
-    """ Возвращает детальную информацию конкретного поста """
-    return await services.get_post_by_id(
-        post_id=post.id, post_repo=post_repo
-    )
+        request: Request,
+        post_id: int = Path(..., ge=1),
+        post_repo: PostRepository = Depends(get_repository(PostRepository)),
+        post_cache: PostCache = Depends(get_post_cache)
+) -> Response:
+    """
+    Возвращает детальную информацию конкретного поста.
+    Готовый ответ берётся из кэша воркера, при промахе пост читается из бд.
+    Ответ содержит ETag по версии поста, при совпадении If-None-Match возвращается 304
+    """
+    try:
+        rendered = await post_cache.get(post_id=post_id, post_repo=post_repo)
+    except EntityDoesNotExist:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post does not exist",
+        )
+    if http_cache.is_not_modified(request, rendered.headers):
+        return http_cache.not_modified(rendered.headers)
+    return Response(content=rendered.body, media_type="application/json", headers=rendered.headers)
 
 
 @post_router.post(
@@ -64,42 +124,70 @@ async def handler_get_post(
     response_model=Post
 )
 async def handler_create_post(
-        back_tasks: BackgroundTasks,
         text: str = Body(default=None),
         link: str = Body(default=None),
         files: list[UploadFile] = File(
             default=None, description="Возможность добавить несколько картинок/видео"),
         current_user: UserBase = Depends(get_current_user),
-        post_repo: PostRepository = Depends(get_repository(PostRepository))
+        post_repo: PostRepository = Depends(get_repository(PostRepository)),
+        media_repo: MediaRepository = Depends(get_repository(MediaRepository)),
+        storage: MediaStorage = Depends(get_media_storage),
+        preview_fetcher: PreviewFetcher = Depends(get_preview_fetcher),
+        preview_worker: PreviewWorker = Depends(get_preview_worker),
+        settings: AppSettings = Depends(get_app_settings)
 ) -> Post:
-    """ Добавление поста в блог. Одно из полей обязательно"""
+    """
+    Добавление поста в блог. Одно из полей обязательно.
+    В режиме preview_mode=background пост создаётся сразу с preview {"status": "pending"},
+    а preview загружается фоновым пулом
+    """
+    files = files or []
     if not text and not link and files == []:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="One of the fields is required"
         )
-    if files != []:
-        files = await save_files(
-            user=current_user,
-            files=files,
-            back_tasks=back_tasks
+    defer_preview = settings.preview_mode == "background" and bool(link) and link.startswith("http")
+    # пост создаётся после сохранения файлов и preview, при ошибке ссылки на них освобождаются
+    async with services.release_on_error(storage=storage, media_repo=media_repo) as acquired:
+        if files != []:
+            try:
+                files = await save_files(
+                    files=files,
+                    storage=storage,
+                    media_repo=media_repo,
+                    settings=settings
+                )
+            except MediaTooLarge as e:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=str(e)
+                )
+            acquired.extend(files)
+        if defer_preview:
+            preview = dict(PENDING_PREVIEW)
+        else:
+            preview = await preview_fetcher.get_content_by_link(link=link, media_repo=media_repo)
+            if preview and preview.get("file"):
+                acquired.append(preview["file"])
+        post_create = PostCreate(
+            text=text,
+            link=link,
+            preview=preview,
+            files=", ".join([file_name for file_name in files])
         )
-    preview = await get_content_by_link(
-        link=link,
-        user=current_user,
-        back_tasks=back_tasks
-    )
-    post_create = PostCreate(
-        text=text,
-        link=link,
-        preview=preview,
-        files=", ".join([file_name for file_name in files])
-    )
-    return await services.create_post(
-        post=post_create,
-        author_id=current_user.id,
-        post_repo=post_repo
-    )
+        post = await services.create_post(
+            post=post_create,
+            author_id=current_user.id,
+            post_repo=post_repo
+        )
+    if defer_preview and not preview_worker.submit(post_id=post.id, link=link):
+        preview = await preview_fetcher.get_content_by_link(link=link, media_repo=media_repo)
+        if await post_repo.update_preview(post_id=post.id, preview=preview):
+            post.preview = preview
+        elif preview and preview.get("file"):
+            await storage.release(paths=[preview["file"]], media_repo=media_repo)
+    return post
 
 
 @post_router.post(
@@ -112,14 +200,22 @@ async def handler_create_post(
 async def handler_add_like(
         post: Post = Depends(get_post_by_id_from_path),
         post_repo: PostRepository = Depends(get_repository(PostRepository)),
+        post_cache: PostCache = Depends(get_post_cache),
         current_user: UserBase = Depends(get_current_user)
 ) -> PostLikeCount:
     """ Лайк поста. Лайкнуть пост можно только 1 раз при повторном нажатии лайк снимается """
-    return await services.like_post(
-        user_id=current_user.id,
-        post_id=post.id,
-        post_repo=post_repo
-    )
+    try:
+        return await services.like_post(
+            user_id=current_user.id,
+            post_id=post.id,
+            post_cache=post_cache,
+            post_repo=post_repo
+        )
+    except EntityDoesNotExist:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Post does not exist",
+        )
 
 
 @post_router.delete(
@@ -131,7 +227,16 @@ async def handler_add_like(
 )
 async def handler_delete_post(
         post: Post = Depends(get_post_by_id_from_path),
-        post_repo: PostRepository = Depends(get_repository(PostRepository))
+        post_repo: PostRepository = Depends(get_repository(PostRepository)),
+        media_repo: MediaRepository = Depends(get_repository(MediaRepository)),
+        storage: MediaStorage = Depends(get_media_storage),
+        post_cache: PostCache = Depends(get_post_cache)
 ) -> None:
     """ Удаление поста. Доступно только автору поста """
-    await post_repo.delete(post_id=post.id)
+    await services.delete_post(
+        post=post,
+        post_repo=post_repo,
+        storage=storage,
+        media_repo=media_repo,
+        post_cache=post_cache
+    )
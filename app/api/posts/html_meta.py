@@ -0,0 +1,105 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import AsyncIterator
+
+NOT_FOUND = "Not found"
+
+_WANTED_META = {"og:description", "description", "og:image"}
+_SNIFF_BYTES = 1024
+_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""", re.IGNORECASE)
+
+
+class _HeadMetaParser(HTMLParser):
+    """ Собирает нужные <meta> теги и отмечает конец <head> """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.meta: dict[str, str] = {}
+        self.done = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag == "meta":
+            attributes = dict(attrs)
+            key = attributes.get("property") or attributes.get("name")
+            if key:
+                key = key.lower()
+                content = attributes.get("content")
+                if key in _WANTED_META and key not in self.meta and content:
+                    self.meta[key] = content
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "head":
+            self.done = True
+
+
+class MetaExtractor:
+    """
+    Потоковое извлечение описания и фото страницы из <meta> тегов.
+    Разбор останавливается на </head> (или <body>), либо после max_bytes байт.
+    Кодировка берётся из заголовка ответа, затем из <meta charset>, иначе utf-8
+    """
+
+    def __init__(self, max_bytes: int, charset: str | None = None) -> None:
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self._charset = charset
+        self._decoder: codecs.IncrementalDecoder | None = None
+        self._pending = b""
+        self._parser = _HeadMetaParser()
+
+    @property
+    def done(self) -> bool:
+        return self._parser.done or self.bytes_read >= self.max_bytes
+
+    def feed(self, chunk: bytes) -> bool:
+        """ Разбирает очередной блок байт, True если читать дальше не нужно """
+        chunk = chunk[:self.max_bytes - self.bytes_read]
+        self.bytes_read += len(chunk)
+        if self._decoder is None:
+            self._pending += chunk
+            if len(self._pending) < _SNIFF_BYTES and not self.done:
+                return False
+            chunk, self._pending = self._pending, b""
+            self._decoder = _make_decoder(self._charset or _sniff_charset(chunk))
+        self._parser.feed(self._decoder.decode(chunk))
+        return self.done
+
+    def result(self) -> tuple[str, str]:
+        """ Возвращает описание и фото страницы """
+        if self._decoder is None:
+            self._decoder = _make_decoder(self._charset or _sniff_charset(self._pending))
+            self._parser.feed(self._decoder.decode(self._pending, final=True))
+            self._pending = b""
+        meta = self._parser.meta
+        description = meta.get("og:description") or meta.get("description") or NOT_FOUND
+        image = meta.get("og:image") or NOT_FOUND
+        return description, image
+
+
+async def extract_meta(
+        chunks: AsyncIterator[bytes],
+        max_bytes: int,
+        charset: str | None = None
+) -> tuple[str, str]:
+    """ Читает страницу блоками, пока не найден конец <head> или не прочитано max_bytes """
+    extractor = MetaExtractor(max_bytes=max_bytes, charset=charset)
+    async for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    return extractor.result()
+
+
+def _sniff_charset(data: bytes) -> str | None:
+    match = _CHARSET_RE.search(data[:_SNIFF_BYTES])
+    return match.group(1).decode("ascii") if match else None
+
+
+def _make_decoder(charset: str | None) -> codecs.IncrementalDecoder:
+    try:
+        decoder_class = codecs.getincrementaldecoder(charset or "utf-8")
+    except LookupError:
+        decoder_class = codecs.getincrementaldecoder("utf-8")
+    return decoder_class(errors="replace")
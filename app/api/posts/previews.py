@@ -0,0 +1,318 @@
+import asyncio
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from asyncpg.pool import Pool
+
+from app import metrics
+from app.api.posts.html_meta import extract_meta
+from app.cache import SingleFlight, TTLCache
+from app.config import AppSettings
+from app.db.connection import LazyConnection, open_dedicated_connection
+from app.db.repositories.media import MediaRepository
+from app.db.repositories.post import PostRepository
+from app.logging.logger import logger
+from app.profiling import timed
+from app.storage.media import MediaStorage, MediaTooLarge
+
+if TYPE_CHECKING:
+    from aiohttp import ClientSession
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+_HTML_CHUNK_SIZE = 16 * 1024
+
+PENDING_PREVIEW = {"status": "pending"}
+# ключ pg_advisory_lock, под которым посты с pending preview возвращает в очередь только один процесс
+RESUME_LOCK_ID = 7_336_203
+
+
+def normalize_url(link: str) -> str:
+    """ Приводит ссылку к виду, в котором она используется как ключ кэша preview """
+    parts = urlsplit(link.strip())
+    scheme = parts.scheme.lower()
+    try:
+        port = parts.port
+    except ValueError:
+        return link
+    netloc = (parts.hostname or "").lower()
+    if port is not None and _DEFAULT_PORTS.get(scheme) != port:
+        netloc = f"{netloc}:{port}"
+    if parts.username:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+class PreviewFetcher:
+    """
+    Получение preview по ссылке.
+    Успешно полученные preview кэшируются по нормализованной ссылке,
+    повторные ссылки на ту же страницу не обращаются к сети, а одновременные
+    запросы одной и той же ссылки выполняются одним запросом.
+    HTTP-сессия (и aiohttp) создаётся при первой загрузке страницы
+    """
+
+    def __init__(
+            self,
+            cache: TTLCache,
+            storage: MediaStorage,
+            settings: AppSettings
+    ) -> None:
+        self.cache = cache
+        self.storage = storage
+        self.settings = settings
+        self._session: "ClientSession | None" = None
+        self._in_flight = SingleFlight()
+
+    @property
+    def session(self) -> "ClientSession":
+        if self._session is None:
+            import aiohttp
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.settings.preview_connection_limit,
+                    limit_per_host=self.settings.preview_connection_limit_per_host,
+                    ttl_dns_cache=self.settings.preview_dns_cache_ttl_seconds
+                ),
+                timeout=aiohttp.ClientTimeout(self.settings.preview_timeout_seconds)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get_content_by_link(
+            self,
+            link: str,
+            media_repo: MediaRepository
+    ) -> dict[str, str]:
+        """ Получение preview по ссылке """
+        if not link or not link.startswith("http"):
+            return {"message": "null"}
+        cache_key = normalize_url(link)
+        preview = self.cache.get(cache_key)
+        if preview is not None and await self._reference_file(preview, media_repo):
+            metrics.preview_fetches.inc("cache_hit")
+            return dict(preview)
+        try:
+            with timed("preview"):
+                preview, shared = await self._in_flight.do(
+                    cache_key, lambda: self._fetch_preview(link=link, media_repo=media_repo)
+                )
+                if shared and preview and not await self._reference_file(preview, media_repo):
+                    preview = await self._fetch_preview(link=link, media_repo=media_repo)
+        except Exception:
+            metrics.preview_fetches.inc("error")
+            raise
+        metrics.preview_fetches.inc(_fetch_outcome(preview, shared))
+        if preview and "description" in preview:
+            self.cache.set(cache_key, dict(preview))
+        return preview
+
+    async def _reference_file(
+            self,
+            preview: dict[str, str],
+            media_repo: MediaRepository
+    ) -> bool:
+        """ Добавляет ссылку на фото готового preview, False если фото уже удалено """
+        file_name = preview.get("file")
+        if not file_name or self.storage.digest_from_path(file_name) is None:
+            return True
+        return await self.storage.reference(path=file_name, media_repo=media_repo)
+
+    async def _fetch_preview(
+            self,
+            link: str,
+            media_repo: MediaRepository
+    ) -> dict[str, str]:
+        """ Загружает страницу по ссылке и фото для preview """
+        from aiohttp import InvalidURL
+
+        try:
+            async with self.session.get(link, ssl=False) as response:
+                if response.status == 200:
+                    description, image_to_url = await extract_meta(
+                        chunks=response.content.iter_chunked(_HTML_CHUNK_SIZE),
+                        max_bytes=self.settings.preview_max_html_bytes,
+                        charset=response.charset
+                    )
+                    if image_to_url.startswith("http"):
+                        preview = await _get_image_to_url(
+                            session=self.session,
+                            description=description,
+                            url=image_to_url,
+                            storage=self.storage,
+                            media_repo=media_repo,
+                            chunk_size=self.settings.media_chunk_size
+                        )
+                        return preview
+                    else:
+                        return {"description": description, "file": "Not found"}
+                return {"message": "Preview unavailable"}
+        except InvalidURL as e:
+            logger.exception(e)
+            return {"message": "Invalid URL"}
+
+
+class PreviewWorker:
+    """
+    Пул фоновых задач, которые получают preview уже созданных постов
+    и записывают его в posts.preview. Очередь ограничена queue_size заданиями,
+    одновременно обрабатывается не больше concurrency ссылок.
+    При старте один из процессов возвращает в очередь посты, preview которых остался в статусе pending
+    после остановки воркера, при остановке очередь дорабатывается не дольше shutdown_timeout секунд
+    """
+
+    def __init__(
+            self,
+            fetcher: PreviewFetcher,
+            pool: Pool,
+            concurrency: int,
+            queue_size: int,
+            shutdown_timeout: float
+    ) -> None:
+        self._fetcher = fetcher
+        self._pool = pool
+        self._concurrency = concurrency
+        self._shutdown_timeout = shutdown_timeout
+        self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self._resume_task: asyncio.Task | None = None
+        # сохранение готовых preview не отменяется вместе с заданием, stop дожидается их
+        self._storing: set[asyncio.Task] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._run()) for _ in range(self._concurrency)
+        ]
+        self._resume_task = asyncio.create_task(self._resume_pending())
+
+    async def stop(self) -> None:
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+            await asyncio.gather(self._resume_task, return_exceptions=True)
+            self._resume_task = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self._shutdown_timeout)
+        except asyncio.TimeoutError:
+            # оставшиеся посты сохраняют статус pending и вернутся в очередь при следующем старте
+            logger.warning(f"Очередь preview не обработана до остановки, осталось заданий: {self._queue.qsize()}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.gather(*self._storing, return_exceptions=True)
+
+    def submit(self, post_id: int, link: str) -> bool:
+        """ Ставит пост в очередь на получение preview, False если очередь заполнена """
+        try:
+            self._queue.put_nowait((post_id, link))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _resume_pending(self, batch_size: int = 100) -> None:
+        """
+        Возвращает в очередь посты с preview в статусе pending, ожидая место в очереди.
+        Это делает только процесс, получивший advisory lock, остальные воркеры посты не дублируют.
+        Пост, который уже есть в очереди, обработается дважды, но записан будет только один preview
+        """
+        try:
+            lock_conn = await open_dedicated_connection(self._fetcher.settings)
+        except Exception as e:
+            logger.exception(e)
+            return
+        try:
+            # блокировка сессии снимается вместе с закрытием соединения
+            if not await lock_conn.fetchval("SELECT pg_try_advisory_lock($1)", RESUME_LOCK_ID):
+                return
+            post_repo = PostRepository(LazyConnection(self._pool))
+            after_id = 0
+            while True:
+                pending = await post_repo.get_pending_previews(after_id=after_id, limit=batch_size)
+                for post_id, link in pending:
+                    await self._queue.put((post_id, link))
+                if len(pending) < batch_size:
+                    return
+                after_id = pending[-1][0]
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            await lock_conn.close()
+
+    async def _run(self) -> None:
+        while True:
+            post_id, link = await self._queue.get()
+            try:
+                await self._process(post_id=post_id, link=link)
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, post_id: int, link: str) -> None:
+        conn = LazyConnection(self._pool)
+        media_repo = MediaRepository(conn)
+        try:
+            preview = await self._fetcher.get_content_by_link(
+                link=link, media_repo=media_repo
+            )
+        except Exception as e:
+            logger.exception(e)
+            preview = {"message": "Preview unavailable"}
+        # после загрузки на фото preview уже есть ссылка: отмена задания не должна
+        # прервать запись preview или освобождение ссылки, если пост уже не ждёт preview
+        task = asyncio.create_task(self._store(post_id=post_id, preview=preview))
+        self._storing.add(task)
+        task.add_done_callback(self._storing.discard)
+        await asyncio.shield(task)
+
+    async def _store(self, post_id: int, preview: dict[str, str]) -> None:
+        conn = LazyConnection(self._pool)
+        try:
+            updated = await PostRepository(conn).update_preview(
+                post_id=post_id, preview=preview
+            )
+            if not updated and preview and preview.get("file"):
+                await self._fetcher.storage.release(
+                    paths=[preview["file"]], media_repo=MediaRepository(conn)
+                )
+        except Exception as e:
+            logger.exception(e)
+
+
+def _fetch_outcome(preview: dict[str, str] | None, shared: bool) -> str:
+    """ Исход загрузки preview для метрики preview_fetch_total """
+    if not preview or "description" not in preview:
+        return "invalid_url" if preview == {"message": "Invalid URL"} else "failed"
+    return "coalesced" if shared else "fetched"
+
+
+async def _get_image_to_url(
+        session: "ClientSession",
+        description: str,
+        url: str,
+        storage: MediaStorage,
+        media_repo: MediaRepository,
+        chunk_size: int
+) -> dict[str, str]:
+    """ Получает фото по url для preview и сохраняет его в хранилище """
+    async with session.get(url, ssl=False) as response:
+        if response.status == 200:
+            try:
+                file_name = await storage.put(
+                    chunks=response.content.iter_chunked(chunk_size),
+                    kind="image",
+                    media_repo=media_repo
+                )
+            except MediaTooLarge:
+                return {"description": description, "file": "Not found"}
+            return {"description": description, "file": file_name}
+        return {"description": description, "file": "Not found"}
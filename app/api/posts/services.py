@@ -1,27 +1,83 @@
-from uuid import uuid4
+import base64
+import binascii
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
-import aiofiles
-import aiohttp
-from aiohttp import ClientSession, InvalidURL
-from bs4 import BeautifulSoup
 from fastapi import Depends, UploadFile
-from starlette.background import BackgroundTasks
 
 from app.api.dependencies.database import get_repository
+from app.api.posts.cache import PostCache
+from app.config import AppSettings
+from app.db.repositories.media import MediaRepository
 from app.db.repositories.post import PostRepository
-from app.db.schemas.post import Post, PostCreate, PostLikeCount, ListOfPostsInResponse
+from app.db.schemas.post import (
+    Post,
+    PostCreate,
+    PostLikeCount,
+    ListOfPostsInResponse,
+    PaginationDirection
+)
 from app.db.schemas.user import UserBase
-from app.logging.logger import logger
+from app.storage.media import MediaStorage, MediaTooLarge
+
+
+# курсор передаётся в запрос как bigint, значения больше не помещаются в параметр
+MAX_CURSOR = 2 ** 63 - 1
+
+
+class InvalidCursor(Exception):
+    """ Возникает, когда курсор пагинации не удалось декодировать """
+
+
+def encode_cursor(post_id: int) -> str:
+    """ Кодирует идентификатор поста в непрозрачный курсор """
+    return base64.urlsafe_b64encode(str(post_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """ Декодирует курсор в идентификатор поста """
+    try:
+        post_id = int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(f"Invalid cursor {cursor}")
+    if not 1 <= post_id <= MAX_CURSOR:
+        raise InvalidCursor(f"Invalid cursor {cursor}")
+    return post_id
 
 
 async def get_all_posts(
         page: int = 0,
         limit: int = 5,
+        cursor: str | None = None,
+        direction: PaginationDirection = PaginationDirection.after,
         post_repo: PostRepository = Depends(get_repository(PostRepository))
 ) -> ListOfPostsInResponse:
-    """ Сервис для постраничного вывода постов """
-    posts = await post_repo.get_all(page=page, limit=limit)
-    return ListOfPostsInResponse(posts=posts)
+    """
+    Сервис для постраничного вывода постов.
+    Если передан cursor, используется курсорная навигация, иначе page.
+    next_cursor ведёт к более старым постам (direction=after), prev_cursor - к более новым
+    (direction=before), курсор не возвращается, если в эту сторону постов больше нет
+    """
+    if cursor is not None:
+        posts = await post_repo.get_all_by_cursor(
+            cursor=decode_cursor(cursor),
+            limit=limit,
+            direction=direction
+        )
+        full_page = len(posts) == limit
+        # в сторону, откуда пришёл клиент, посты есть всегда: как минимум пост курсора
+        has_older = full_page or direction == PaginationDirection.before
+        has_newer = full_page or direction == PaginationDirection.after
+    else:
+        posts = await post_repo.get_all(page=page, limit=limit)
+        has_older = len(posts) == limit
+        has_newer = page > 0
+    return ListOfPostsInResponse.construct(
+        posts=posts,
+        next_cursor=encode_cursor(posts[-1].id) if posts and has_older else None,
+        prev_cursor=encode_cursor(posts[0].id) if posts and has_newer else None
+    )
 
 
 async def get_post_by_id(
@@ -44,13 +100,14 @@ async def create_post(
 async def like_post(
         post_id: int,
         user_id: int,
+        post_cache: PostCache,
         post_repo: PostRepository = Depends(get_repository(PostRepository))
 ) -> PostLikeCount:
-    """ Сервис для добавления лайка на пост """
-    if await post_repo.get_users_like_post(post_id=post_id, user_id=user_id):
-        return await post_repo.remove_like(post_id=post_id, user_id=user_id)
-    else:
-        return await post_repo.add_like(post_id=post_id, user_id=user_id)
+    """ Сервис для добавления лайка на пост, повторный вызов снимает лайк """
+    try:
+        return await post_repo.toggle_like(post_id=post_id, user_id=user_id)
+    finally:
+        post_cache.invalidate(post_id)
 
 
 def check_user_can_modify_comment(post: Post, user: UserBase) -> bool:
@@ -59,91 +116,82 @@ def check_user_can_modify_comment(post: Post, user: UserBase) -> bool:
 
 
 async def save_files(
-        user: UserBase,
         files: list[UploadFile],
-        back_tasks: BackgroundTasks
+        storage: MediaStorage,
+        media_repo: MediaRepository,
+        settings: AppSettings
 ) -> list[str]:
-    """ Сервис для хранения media контента на сервере """
-    files_list = []
-    for file in files:
-        if file.content_type.startswith("image"):
-            file_name = f'app/media/image/{user.id}_{uuid4()}.png'
-        else:
-            file_name = f'app/media/video/{user.id}_{uuid4()}.mp4'
-        back_tasks.add_task(_write_media, file_name, file)
-        files_list.append(file_name)
+    """
+    Сервис для хранения media контента на сервере. Загрузки, которые Starlette
+    уже сбросил на диск, копируются ядром, остальные пишутся блоками.
+    Если файл сохранить не удалось, ссылки на уже сохранённые освобождаются
+    """
+    max_size = settings.media_max_file_size
+    if max_size is not None:
+        for file in files:
+            if _get_upload_size(file) > max_size:
+                raise MediaTooLarge(f"File {file.filename} is larger than {max_size} bytes")
+    async with release_on_error(storage=storage, media_repo=media_repo) as files_list:
+        for file in files:
+            kind = "image" if file.content_type.startswith("image") else "video"
+            if getattr(file.file, "_rolled", False) and hasattr(os, "sendfile"):
+                file_name = await storage.put_file(fd=file.file.fileno(), kind=kind, media_repo=media_repo)
+            else:
+                file_name = await storage.put(
+                    chunks=_iter_upload(file, settings.media_chunk_size),
+                    kind=kind,
+                    media_repo=media_repo
+                )
+            files_list.append(file_name)
     return files_list
 
 
-async def _write_media(file_name: str, file: UploadFile):
-    """ Записывает файл на диск """
-    async with aiofiles.open(file_name, "wb") as buffer:
-        data = await file.read()
-        await buffer.write(data)
-
-
-async def _write_preview_media(file_name: str, data: bytes):
-    """ Записывает файл полученный с preview на диск """
-    async with aiofiles.open(file_name, "wb") as buffer:
-        await buffer.write(data)
-
-
-async def get_content_by_link(
-        link: str,
-        user: UserBase,
-        back_tasks: BackgroundTasks
-) -> dict[str, str]:
-    """Получение preview по ссылке"""
-    if not link or not link.startswith("http"):
-        return {"message": "null"}
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(60)) as session:
-        try:
-            async with session.get(link, ssl=False) as response:
-                html = await response.text()
-                if response.status == 200:
-                    description, image_to_url = _parse_content(html=html)
-                    if image_to_url.startswith("http"):
-                        preview = await _get_image_to_url(
-                            session=session,
-                            description=description,
-                            url=image_to_url,
-                            user_id=user.id,
-                            back_tasks=back_tasks
-                        )
-                        return preview
-                    else:
-                        return {"description": description, "file": "Not found"}
-        except InvalidURL as e:
-            logger.exception(e)
-            return {"message": "Invalid URL"}
-
-
-async def _get_image_to_url(
-        session: ClientSession,
-        description: str,
-        url: str,
-        user_id: int,
-        back_tasks: BackgroundTasks
-) -> dict[str, str]:
-    """ Получает фото по url для preview """
-    async with session.get(url, ssl=False) as response:
-        data = await response.read()
-        if response.status == 200:
-            file_name = f'app/media/image/{user_id}_{uuid4()}.png'
-            back_tasks.add_task(_write_preview_media, file_name, data)
-            return {"description": description, "file": file_name}
-
-
-def _parse_content(html: str) -> tuple[str, str]:
-    """ Возвращает описание и фото по ссылке """
-    soup = BeautifulSoup(html, 'html.parser')
-
-    content = soup.find("meta", property="og:description")
-    if not content:
-        content = soup.find(attrs={'name': 'description'})
-    description = content.get("content", None) if content else "Not found"
-
-    media_file = soup.find("meta", property="og:image")
-    image = media_file.get("content", None) if media_file else "Not found"
-
-    return description, image
+@asynccontextmanager
+async def release_on_error(
+        storage: MediaStorage,
+        media_repo: MediaRepository
+) -> AsyncIterator[list[str]]:
+    """
+    Список путей media файлов, на которые в блоке добавлены ссылки.
+    Если блок завершился исключением, ссылки освобождаются
+    """
+    acquired: list[str] = []
+    try:
+        yield acquired
+    except BaseException:
+        await storage.release(paths=acquired, media_repo=media_repo)
+        raise
+
+
+def _get_upload_size(file: UploadFile) -> int:
+    """ Размер загруженного файла без чтения его содержимого """
+    position = file.file.tell()
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(position)
+    return size
+
+
+async def _iter_upload(file: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    """ Читает загруженный файл блоками по chunk_size байт """
+    await file.seek(0)
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def delete_post(
+        post: Post,
+        post_repo: PostRepository,
+        storage: MediaStorage,
+        media_repo: MediaRepository,
+        post_cache: PostCache
+) -> None:
+    """ Сервис для удаления поста вместе со ссылками на его media файлы """
+    media_files = [file_name for file_name in (post.files or "").split(", ") if file_name]
+    if post.preview and post.preview.get("file"):
+        media_files.append(post.preview["file"])
+    async with post_repo.connection.transaction():
+        await post_repo.delete(post_id=post.id)
+        removed = await storage.release_references(paths=media_files, media_repo=media_repo)
+    # файлы удаляются только после фиксации, при откате транзакции они ещё нужны
+    await storage.remove_files(paths=removed, media_repo=media_repo)
+    post_cache.invalidate(post.id)
@@ -0,0 +1,31 @@
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.db.schemas.post import ListOfPostsInResponse, Post
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson рендерит ответ заметно быстрее json.dumps, без него - обычный JSONResponse
+FastJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+
+def post_content(post: Post) -> dict:
+    """ Содержимое ответа с постом без повторной валидации response_model """
+    return dict(post)
+
+
+def validated_post_content(post: Post) -> dict:
+    """ Содержимое ответа с постом, как его строил response_model: валидация и jsonable_encoder """
+    return jsonable_encoder(Post(**post.dict()))
+
+
+def posts_content(posts: ListOfPostsInResponse) -> dict:
+    """ Содержимое ответа со списком постов без повторной валидации response_model """
+    return {
+        "posts": [dict(post) for post in posts.posts],
+        "next_cursor": posts.next_cursor,
+        "prev_cursor": posts.prev_cursor,
+    }
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import BaseSettings, SecretStr
 
@@ -21,11 +21,16 @@ class AppSettings(BaseAppSettings):
 
     max_connection_count: int = 10
     min_connection_count: int = 10
+    statement_cache_size: int = 100
     postgres_user: str
     postgres_password: str
     postgres_database: str
     postgres_host: str
     postgres_port: str
+    postgres_replica_dsns: list[str] = []
+    read_your_writes_seconds: int = 5
+    read_your_writes_max_users: int = 100000
+    migrations_on_startup: Literal["apply", "check", "off"] = "check"
 
     access_secret_key: SecretStr
     refresh_secret_key: SecretStr
@@ -35,6 +40,49 @@ class AppSettings(BaseAppSettings):
 
     jwt_algorithm: str = "HS256"
 
+    user_cache_max_size: int = 10000
+    user_cache_ttl_seconds: int = 300
+
+    password_hashing_workers: int = 4
+    password_hashing_queue_size: int = 64
+    password_hashing_use_processes: bool = False
+
+    media_root: str = "app/media"
+    media_chunk_size: int = 1024 * 1024
+    media_max_file_size: int | None = None
+
+    preview_timeout_seconds: int = 60
+    preview_max_html_bytes: int = 256 * 1024
+    preview_connection_limit: int = 100
+    preview_connection_limit_per_host: int = 4
+    preview_dns_cache_ttl_seconds: int = 300
+    preview_cache_max_size: int = 10000
+    preview_cache_ttl_seconds: int = 60 * 60
+    preview_mode: Literal["sync", "background"] = "sync"
+    preview_workers: int = 8
+    preview_queue_size: int = 1000
+    preview_shutdown_timeout_seconds: float = 10.0
+
+    posts_serialization: Literal["validated", "fast"] = "fast"
+    posts_cache_control: str = "public, no-cache"
+    post_cache_max_size: int = 10000
+    post_cache_ttl_seconds: int = 30
+
+    log_level: str = "DEBUG"
+    log_console_level: str = "DEBUG"
+    log_file_level: str = "DEBUG"
+    log_file: str | None = "app/logging/logs/logs.log"
+    log_format: Literal["text", "json"] = "text"
+    log_queue_size: int = 10000
+    log_queue_policy: Literal["drop", "block"] = "drop"
+    log_queue_block_timeout_seconds: float = 0.1
+    log_exception_burst: int = 5
+    log_exception_interval_seconds: float = 60
+
+    metrics_enabled: bool = True
+    profiling_sample_rate: float = 0.0
+    profiling_slow_request_ms: int = 500
+
     allowed_hosts: list[str] = ["*"]
 
     class Config:
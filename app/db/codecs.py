@@ -0,0 +1,42 @@
+"""
+Кодеки типов PostgreSQL для соединений пула.
+jsonb приходит из бд уже разобранным, для разбора используется orjson,
+если он установлен, иначе стандартный json
+"""
+import json
+from typing import Any
+
+from asyncpg.connection import Connection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# версия бинарного формата jsonb, предшествует тексту документа
+_JSONB_VERSION = b"\x01"
+
+
+if orjson is not None:
+    def encode_jsonb(value: Any) -> bytes:
+        return _JSONB_VERSION + orjson.dumps(value)
+
+    def decode_jsonb(data: bytes) -> Any:
+        return orjson.loads(memoryview(data)[1:])
+else:
+    def encode_jsonb(value: Any) -> bytes:
+        return _JSONB_VERSION + json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+    def decode_jsonb(data: bytes) -> Any:
+        return json.loads(data[1:])
+
+
+async def register_codecs(conn: Connection) -> None:
+    """ Регистрирует кодеки на соединении, до подготовки запросов """
+    await conn.set_type_codec(
+        "jsonb",
+        schema="pg_catalog",
+        encoder=encode_jsonb,
+        decoder=decode_jsonb,
+        format="binary"
+    )
@@ -1,24 +1,139 @@
+import functools
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, TypeVar
+
 import asyncpg
+from asyncpg.connection import Connection
+from asyncpg.pool import Pool
+from asyncpg.prepared_stmt import PreparedStatement
 from fastapi import FastAPI
 
+from app import metrics
 from app.config import AppSettings
+from app.db.codecs import register_codecs
+from app.db.errors import StatementPreparationError
+from app.db.statements import Statement, registry
 from app.logging.logger import logger
+from app.profiling import timed
+
+T = TypeVar("T")
+
+# запросы внутри метода, помеченного read_only, можно выполнять на реплике
+_read_only: ContextVar[bool] = ContextVar("read_only", default=False)
+# чтения внутри primary_reads идут на primary, даже если метод помечен read_only
+_primary_reads: ContextVar[bool] = ContextVar("primary_reads", default=False)
+
+
+class AppConnection(Connection):
+    """
+    Соединение пула с заранее подготовленными запросами из реестра.
+    Запрос из реестра выполняется готовым планом, остальные - как обычно
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._prepared: dict[str, PreparedStatement] = {}
+
+    async def prepare_statements(self, statements: Iterable[Statement]) -> None:
+        """ Подготавливает запросы, ошибка подготовки содержит имя запроса """
+        for statement in statements:
+            try:
+                self._prepared[statement.name] = await self.prepare(str(statement))
+            except asyncpg.PostgresError as e:
+                raise StatementPreparationError(
+                    f"Statement {statement.name} failed to prepare: {e}"
+                ) from e
+
+    async def fetch(self, query: str, *args: Any, timeout: float | None = None, **kwargs: Any) -> list:
+        prepared = self._get_prepared(query)
+        if prepared is None or kwargs:
+            return await super().fetch(query, *args, timeout=timeout, **kwargs)
+        return await prepared.fetch(*args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args: Any, timeout: float | None = None, **kwargs: Any) -> Any:
+        prepared = self._get_prepared(query)
+        if prepared is None or kwargs:
+            return await super().fetchrow(query, *args, timeout=timeout, **kwargs)
+        return await prepared.fetchrow(*args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args: Any, column: int = 0, timeout: float | None = None) -> Any:
+        prepared = self._get_prepared(query)
+        if prepared is None:
+            return await super().fetchval(query, *args, column=column, timeout=timeout)
+        return await prepared.fetchval(*args, column=column, timeout=timeout)
+
+    async def execute(self, query: str, *args: Any, timeout: float | None = None) -> str:
+        prepared = self._get_prepared(query)
+        if prepared is None:
+            return await super().execute(query, *args, timeout=timeout)
+        await prepared.fetch(*args, timeout=timeout)
+        return prepared.get_statusmsg()
+
+    async def executemany(self, command: str, args: Any, *, timeout: float | None = None) -> None:
+        prepared = self._get_prepared(command)
+        if prepared is None:
+            return await super().executemany(command, args, timeout=timeout)
+        return await prepared.executemany(args, timeout=timeout)
+
+    def _get_prepared(self, query: str) -> PreparedStatement | None:
+        if isinstance(query, Statement):
+            return self._prepared.get(query.name)
+        return None
+
+
+async def init_connection(conn: AppConnection) -> None:
+    """ Настройка нового соединения пула """
+    # подготовленные запросы запоминают кодеки типов, поэтому кодеки регистрируются первыми
+    await register_codecs(conn)
+    await conn.prepare_statements(registry)
+
+
+async def check_statements(pool: Pool) -> None:
+    """ Проверяет при старте, что все запросы реестра подготавливаются на текущей схеме бд """
+    async with pool.acquire() as conn:
+        await conn.prepare_statements(registry)
 
 
 async def connect_to_db(app: FastAPI, settings: AppSettings) -> None:
-    """ Открывает соединение с бд """
+    """ Открывает соединение с бд и с репликами для чтения, если они заданы """
     logger.info("Подключение к PostgreSQL")
 
-    app.state.pool = await asyncpg.create_pool(
+    app.state.pool = await _create_pool(settings, **_connect_kwargs(settings))
+    app.state.read_pools = ReadPools([
+        await _create_pool(settings, dsn=dsn) for dsn in settings.postgres_replica_dsns
+    ])
+    for pool in (app.state.pool, *app.state.read_pools.pools):
+        await check_statements(pool)
+    logger.info(f"Открыто соединение с пулом базы данных, реплик для чтения: {len(app.state.read_pools)}")
+
+
+async def _create_pool(settings: AppSettings, **connect_kwargs: Any) -> Pool:
+    return await asyncpg.create_pool(
         min_size=settings.min_connection_count,
         max_size=settings.max_connection_count,
-        host=settings.postgres_host,
-        port=settings.postgres_port,
-        user=settings.postgres_user,
-        password=settings.postgres_password,
-        database=settings.postgres_database,
+        **connect_kwargs,
+        statement_cache_size=settings.statement_cache_size,
+        connection_class=AppConnection,
+        init=init_connection,
     )
-    logger.info("Открыто соединение с пулом базы данных")
+
+
+async def open_dedicated_connection(settings: AppSettings) -> Connection:
+    """ Отдельное от пула соединение, например для LISTEN """
+    return await asyncpg.connect(**_connect_kwargs(settings))
+
+
+def _connect_kwargs(settings: AppSettings) -> dict[str, Any]:
+    return {
+        "host": settings.postgres_host,
+        "port": settings.postgres_port,
+        "user": settings.postgres_user,
+        "password": settings.postgres_password,
+        "database": settings.postgres_database,
+    }
 
 
 async def close_db_connection(app: FastAPI) -> None:
@@ -26,5 +141,137 @@ async def close_db_connection(app: FastAPI) -> None:
     logger.info("Закрытие соединения с базой данных")
 
     await app.state.pool.close()
+    await app.state.read_pools.close()
 
     logger.info("Соединение закрыто")
+
+
+class ReadPools:
+    """ Пулы реплик для чтения, выбираются по кругу """
+
+    def __init__(self, pools: list[Pool]) -> None:
+        self.pools = pools
+        self._cycle = itertools.cycle(pools)
+
+    def __len__(self) -> int:
+        return len(self.pools)
+
+    def next(self) -> Pool:
+        return next(self._cycle)
+
+    async def close(self) -> None:
+        for pool in self.pools:
+            await pool.close()
+
+
+def read_only(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """ Помечает метод репозитория, который только читает: его запросы могут идти на реплику """
+
+    @functools.wraps(method)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        token = _read_only.set(True)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            _read_only.reset(token)
+
+    return wrapper
+
+
+@contextmanager
+def primary_reads() -> Iterator[None]:
+    """ Чтения внутри блока выполняются на primary, например когда результат кэшируется """
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class LazyConnection:
+    """
+    Соединение для репозиториев, которое берётся из пула только на время
+    одного запроса к бд или транзакции и сразу возвращается обратно.
+    Занятость пула определяется работой с бд, а не длительностью HTTP-запроса.
+    Запросы методов read_only идут на реплики из read_pools, пока через это
+    соединение ничего не записано; транзакции всегда выполняются на primary
+    """
+
+    def __init__(self, pool: Pool, read_pools: ReadPools | None = None) -> None:
+        self._pool = pool
+        self._read_pools = read_pools
+        self._conn: Connection | None = None
+        self._wrote = False
+
+    async def fetch(self, query: str, *args: Any, **kwargs: Any) -> list[asyncpg.Record]:
+        return await self._run("fetch", query, *args, **kwargs)
+
+    async def fetchrow(self, query: str, *args: Any, **kwargs: Any) -> asyncpg.Record | None:
+        return await self._run("fetchrow", query, *args, **kwargs)
+
+    async def fetchval(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._run("fetchval", query, *args, **kwargs)
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> str:
+        return await self._run("execute", query, *args, **kwargs)
+
+    async def executemany(self, query: str, args: Any, **kwargs: Any) -> None:
+        return await self._run("executemany", query, args, **kwargs)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """
+        Закрепляет соединение на время транзакции, все запросы внутри идут через него.
+        Вложенная транзакция становится savepoint
+        """
+        if self._conn is not None:
+            async with self._conn.transaction():
+                yield
+            return
+        self._wrote = True
+        async with _acquire(self._pool, "primary") as conn:
+            self._conn = conn
+            try:
+                async with conn.transaction():
+                    yield
+            finally:
+                self._conn = None
+
+    async def _run(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        if self._conn is not None:
+            return await _query(self._conn, method, *args, **kwargs)
+        if not _read_only.get():
+            self._wrote = True
+        elif self._read_pools and not self._wrote and not _primary_reads.get():
+            try:
+                async with _acquire(self._read_pools.next(), "replica") as conn:
+                    return await _query(conn, method, *args, **kwargs)
+            except (OSError, asyncpg.PostgresConnectionError, asyncpg.CannotConnectNowError) as e:
+                logger.warning(f"Реплика недоступна, чтение выполняется на primary: {e}")
+        async with _acquire(self._pool, "primary") as conn:
+            return await _query(conn, method, *args, **kwargs)
+
+
+@asynccontextmanager
+async def _acquire(pool: Pool, role: str) -> AsyncIterator[Connection]:
+    """
+    Соединение пула, время ожидания соединения попадает в профиль запроса как acquire
+    и в метрики пула role (primary или replica)
+    """
+    metrics.db_pool_waiting.inc(role)
+    started = time.perf_counter()
+    try:
+        with timed("acquire"):
+            conn = await pool.acquire()
+    finally:
+        metrics.db_pool_waiting.dec(role)
+        metrics.db_pool_acquire_duration.observe(time.perf_counter() - started, role)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def _query(conn: Connection, method: str, *args: Any, **kwargs: Any) -> Any:
+    with timed("db"):
+        return await getattr(conn, method)(*args, **kwargs)
@@ -1,2 +1,14 @@
 class EntityDoesNotExist(Exception):
-    """Возникает, когда объект не был найден в базе данных"""
\ No newline at end of file
+    """Возникает, когда объект не был найден в базе данных"""
+
+
+class StatementPreparationError(Exception):
+    """Возникает, когда запрос из реестра не подготавливается на схеме бд"""
+
+
+class SchemaOutdated(Exception):
+    """Возникает, когда к бд применены не все миграции"""
+
+
+class EntityAlreadyExists(Exception):
+    """Возникает, когда объект нарушает уникальность в базе данных"""
@@ -1,10 +1,17 @@
+import asyncio
 from typing import Callable
 
 from fastapi import FastAPI
 
+from app.api.authentication.hashing import PasswordHasher
+from app.api.posts.cache import PostCache
+from app.api.posts.previews import PreviewFetcher, PreviewWorker
+from app.cache import TTLCache
 from app.config import AppSettings
-from app.db.connection import close_db_connection, connect_to_db
-from scripts.apply import backend, migrations
+from app.db.connection import close_db_connection, connect_to_db, open_dedicated_connection
+from app.db.migrator import apply_migrations, check_schema_version
+from app.db.repositories.post import PostRepository
+from app.storage.media import MediaStorage
 
 
 def create_start_app_handler(
@@ -12,16 +19,78 @@ def create_start_app_handler(
     settings: AppSettings
 ) -> Callable:
     async def start_app() -> None:
+        # запросы реестра подготавливаются при открытии пула, схема должна быть актуальной
+        await prepare_schema(settings)
         await connect_to_db(app, settings)
-        with backend.lock():
-            backend.apply_migrations(backend.to_apply(migrations))
-            backend.rollback_migrations(backend.to_rollback(migrations))
+        PostRepository.validate_records = settings.posts_serialization == "validated"
+        app.state.user_cache = TTLCache(
+            max_size=settings.user_cache_max_size,
+            ttl=settings.user_cache_ttl_seconds
+        )
+        app.state.recent_writers = TTLCache(
+            max_size=settings.read_your_writes_max_users,
+            ttl=settings.read_your_writes_seconds
+        )
+        app.state.password_hasher = PasswordHasher(
+            max_workers=settings.password_hashing_workers,
+            max_queue_size=settings.password_hashing_queue_size,
+            use_processes=settings.password_hashing_use_processes
+        )
+        app.state.media_storage = MediaStorage(
+            root=settings.media_root,
+            max_file_size=settings.media_max_file_size
+        )
+        app.state.preview_fetcher = PreviewFetcher(
+            cache=TTLCache(
+                max_size=settings.preview_cache_max_size,
+                ttl=settings.preview_cache_ttl_seconds
+            ),
+            storage=app.state.media_storage,
+            settings=settings
+        )
+        app.state.preview_worker = PreviewWorker(
+            fetcher=app.state.preview_fetcher,
+            pool=app.state.pool,
+            concurrency=settings.preview_workers,
+            queue_size=settings.preview_queue_size,
+            shutdown_timeout=settings.preview_shutdown_timeout_seconds
+        )
+        app.state.preview_worker.start()
+        app.state.post_cache = PostCache(
+            cache=TTLCache(
+                max_size=settings.post_cache_max_size,
+                ttl=settings.post_cache_ttl_seconds
+            ),
+            settings=settings
+        )
+        await app.state.post_cache.listen()
 
     return start_app
 
 
+async def prepare_schema(settings: AppSettings) -> None:
+    """
+    Подготовка схемы бд при старте воркера по настройке migrations_on_startup:
+    check - только сверяет применённые миграции (их применяет python -m scripts.migrate),
+    apply - применяет миграции в отдельном потоке, удобно для локальной разработки,
+    off - ничего не делает
+    """
+    if settings.migrations_on_startup == "apply":
+        await asyncio.to_thread(apply_migrations, settings)
+    elif settings.migrations_on_startup == "check":
+        conn = await open_dedicated_connection(settings)
+        try:
+            await check_schema_version(conn)
+        finally:
+            await conn.close()
+
+
 def create_stop_app_handler(app: FastAPI) -> Callable:
     async def stop_app() -> None:
+        await app.state.preview_worker.stop()
+        await app.state.post_cache.close()
         await close_db_connection(app)
+        app.state.password_hasher.shutdown()
+        await app.state.preview_fetcher.close()
 
     return stop_app
\ No newline at end of file
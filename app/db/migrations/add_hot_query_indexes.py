@@ -0,0 +1,49 @@
+"""
+Add unique username to users and indexes on posts.author_id and like_users.user_id
+for login lookups and ON DELETE CASCADE of users.
+
+Indexes are built concurrently, so writes to the tables are not blocked and the migration
+runs outside of a transaction. A failed concurrent build leaves an invalid index behind,
+each build is preceded by dropping it, so the migration can be applied again.
+
+The unique index cannot be built while users holds duplicate usernames. They are checked
+first and reported, because merging accounts that own posts and likes is a manual decision
+"""
+
+from yoyo import step
+
+__depends__ = {"add_post_invalidation_trigger"}
+__transactional__ = False
+
+
+def check_duplicate_usernames(conn):
+    cursor = conn.cursor()
+    cursor.execute("""SELECT username, count(*) FROM users
+                          GROUP BY username
+                          HAVING count(*) > 1
+                          ORDER BY username
+                          LIMIT 5""")
+    duplicates = cursor.fetchall()
+    if duplicates:
+        listed = ", ".join(f"{username!r} ({count})" for username, count in duplicates)
+        raise RuntimeError(
+            f"users.username has duplicates, e.g. {listed}. "
+            f"Rename or merge these users, then apply the migration again"
+        )
+
+
+steps = [
+    step(check_duplicate_usernames),
+    step("""DROP INDEX CONCURRENTLY IF EXISTS users_username_key;"""),
+    step("""CREATE UNIQUE INDEX CONCURRENTLY users_username_key ON users (username);""",
+         """DROP INDEX CONCURRENTLY IF EXISTS users_username_key"""),
+    # ограничение на готовом индексе берёт блокировку таблицы только на время записи в каталог
+    step("""ALTER TABLE users ADD CONSTRAINT users_username_key UNIQUE USING INDEX users_username_key;""",
+         """ALTER TABLE users DROP CONSTRAINT users_username_key"""),
+    step("""DROP INDEX CONCURRENTLY IF EXISTS posts_author_id_idx;"""),
+    step("""CREATE INDEX CONCURRENTLY posts_author_id_idx ON posts (author_id);""",
+         """DROP INDEX CONCURRENTLY IF EXISTS posts_author_id_idx"""),
+    step("""DROP INDEX CONCURRENTLY IF EXISTS like_users_user_id_idx;"""),
+    step("""CREATE INDEX CONCURRENTLY like_users_user_id_idx ON like_users (user_id);""",
+         """DROP INDEX CONCURRENTLY IF EXISTS like_users_user_id_idx""")
+]
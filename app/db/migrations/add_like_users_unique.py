@@ -0,0 +1,24 @@
+"""
+Remove duplicate likes, reconcile posts.like_count and add unique (post_id, user_id) to like_users
+"""
+
+from yoyo import step
+
+__depends__ = {"add_media_table"}
+
+steps = [
+    step("""DELETE FROM like_users a
+                USING like_users b
+                WHERE a.ctid < b.ctid
+                  AND a.post_id = b.post_id
+                  AND a.user_id = b.user_id;"""),
+    step("""UPDATE posts SET like_count = likes.count
+                FROM (SELECT posts.id, count(like_users.post_id) AS count
+                        FROM posts
+                        LEFT JOIN like_users ON like_users.post_id = posts.id
+                        GROUP BY posts.id) AS likes
+                WHERE posts.id = likes.id AND posts.like_count IS DISTINCT FROM likes.count;"""),
+    step("""ALTER TABLE like_users
+                ADD CONSTRAINT like_users_post_id_user_id_key UNIQUE (post_id, user_id);""",
+         """ALTER TABLE like_users DROP CONSTRAINT like_users_post_id_user_id_key""")
+]
@@ -0,0 +1,15 @@
+"""
+Create table media for content-addressed media files
+"""
+
+from yoyo import step
+
+__depends__ = {"create_table"}
+
+steps = [
+    step("""CREATE TABLE media (
+                hash VARCHAR(64) PRIMARY KEY,
+                path VARCHAR(255) NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0);""",
+         """DROP TABLE media""")
+]
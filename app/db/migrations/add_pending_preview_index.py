@@ -0,0 +1,16 @@
+"""
+Partial index on posts with a pending preview, the preview worker reads them on start.
+Built concurrently, so the migration runs outside of a transaction
+"""
+
+from yoyo import step
+
+__depends__ = {"add_hot_query_indexes"}
+__transactional__ = False
+
+steps = [
+    step("""DROP INDEX CONCURRENTLY IF EXISTS posts_pending_preview_idx;"""),
+    step("""CREATE INDEX CONCURRENTLY posts_pending_preview_idx ON posts (id)
+                WHERE preview->>'status' = 'pending';""",
+         """DROP INDEX CONCURRENTLY IF EXISTS posts_pending_preview_idx""")
+]
@@ -0,0 +1,21 @@
+"""
+Notify channel post_invalidated with the post id on every update or delete of posts
+"""
+
+from yoyo import step
+
+__depends__ = {"add_post_version"}
+
+steps = [
+    step("""CREATE FUNCTION notify_post_invalidated() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('post_invalidated', OLD.id::text);
+                    RETURN NULL;
+                END;
+            $$ LANGUAGE plpgsql;""",
+         """DROP FUNCTION notify_post_invalidated()"""),
+    step("""CREATE TRIGGER posts_notify_invalidated
+                AFTER UPDATE OR DELETE ON posts
+                FOR EACH ROW EXECUTE FUNCTION notify_post_invalidated();""",
+         """DROP TRIGGER posts_notify_invalidated ON posts""")
+]
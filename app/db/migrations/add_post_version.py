@@ -0,0 +1,14 @@
+"""
+Add version and updated_at to posts for ETag and Last-Modified of post responses
+"""
+
+from yoyo import step
+
+__depends__ = {"add_like_users_unique"}
+
+steps = [
+    step("""ALTER TABLE posts
+                ADD COLUMN version INTEGER NOT NULL DEFAULT 1,
+                ADD COLUMN updated_at TIMESTAMPTZ NOT NULL DEFAULT now();""",
+         """ALTER TABLE posts DROP COLUMN version, DROP COLUMN updated_at""")
+]
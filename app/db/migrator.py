@@ -0,0 +1,77 @@
+"""
+Применение миграций и проверка версии схемы.
+Миграции применяет отдельная команда python -m scripts.migrate до запуска воркеров,
+воркеры при старте только сверяют применённые миграции с файлами в MIGRATIONS_PATH
+"""
+from pathlib import Path
+from urllib.parse import quote
+
+from asyncpg.connection import Connection
+
+from app.config import AppSettings
+from app.db.errors import SchemaOutdated
+from app.logging.logger import logger
+
+MIGRATIONS_PATH = Path(__file__).parent / "migrations"
+# таблица применённых миграций yoyo, см. yoyo.ini
+MIGRATION_TABLE = "_yoyo_migration"
+# ключ pg_advisory_lock, под которым миграции применяет только один процесс
+MIGRATION_LOCK_ID = 7_336_201
+
+
+def database_url(settings: AppSettings) -> str:
+    """ Адрес бд для yoyo из настроек приложения """
+    user = quote(settings.postgres_user, safe="")
+    password = quote(settings.postgres_password, safe="")
+    return (
+        f"postgresql://{user}:{password}@{settings.postgres_host}:{settings.postgres_port}"
+        f"/{settings.postgres_database}"
+    )
+
+
+def migration_ids() -> set[str]:
+    """ Идентификаторы миграций по именам файлов, без импорта самих миграций """
+    return {path.stem for path in MIGRATIONS_PATH.glob("*.py") if not path.stem.startswith("_")}
+
+
+def apply_migrations(settings: AppSettings) -> list[str]:
+    """
+    Применяет новые миграции под advisory lock и возвращает их идентификаторы.
+    Одновременно запущенные команды ждут друг друга, вторая уже ничего не применяет
+    """
+    import psycopg2
+    from yoyo import get_backend, read_migrations
+
+    lock_conn = psycopg2.connect(database_url(settings))
+    lock_conn.autocommit = True
+    try:
+        with lock_conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        backend = get_backend(database_url(settings), migration_table=MIGRATION_TABLE)
+        migrations = read_migrations(str(MIGRATIONS_PATH))
+        with backend.lock():
+            to_apply = backend.to_apply(migrations)
+            backend.apply_migrations(to_apply)
+        return [migration.id for migration in to_apply]
+    finally:
+        lock_conn.close()
+
+
+async def pending_migrations(conn: Connection) -> set[str]:
+    """ Миграции, файлы которых есть, но которые ещё не применены к бд """
+    table_exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", MIGRATION_TABLE)
+    if not table_exists:
+        return migration_ids()
+    applied = await conn.fetch(f"SELECT migration_id FROM {MIGRATION_TABLE}")
+    return migration_ids() - {row[0] for row in applied}
+
+
+async def check_schema_version(conn: Connection) -> None:
+    """ Быстрая проверка при старте воркера, SchemaOutdated если есть неприменённые миграции """
+    pending = await pending_migrations(conn)
+    if pending:
+        raise SchemaOutdated(
+            f"Database schema is outdated, pending migrations: {', '.join(sorted(pending))}. "
+            f"Run python -m scripts.migrate"
+        )
+    logger.info("Схема бд актуальна")
@@ -1,10 +1,52 @@
+import inspect
+from typing import Any, Hashable
+
 from asyncpg.connection import Connection
 
+from app import metrics
+from app.db.connection import LazyConnection
+
+
+class IdentityMap:
+    """
+    Сущности, уже загруженные в рамках одного запроса.
+    Повторное получение той же сущности отдаётся из памяти без обращения к бд
+    """
+
+    def __init__(self) -> None:
+        self._entities: dict[tuple[type, Hashable], Any] = {}
+
+    def get(self, entity_type: type, key: Hashable) -> Any:
+        return self._entities.get((entity_type, key))
+
+    def add(self, entity_type: type, key: Hashable, entity: Any) -> None:
+        self._entities[(entity_type, key)] = entity
+
+    def discard(self, entity_type: type, key: Hashable) -> None:
+        self._entities.pop((entity_type, key), None)
+
 
 class BaseRepository:
-    def __init__(self, conn: Connection) -> None:
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        """ Длительность публичных методов репозитория попадает в repository_call_duration_seconds """
+        super().__init_subclass__(**kwargs)
+        for name, method in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.iscoroutinefunction(method):
+                series = metrics.repository_call_duration.labels(cls.__name__, name)
+                setattr(cls, name, metrics.timed_calls(series, method))
+
+    def __init__(
+            self,
+            conn: Connection | LazyConnection,
+            identity_map: IdentityMap | None = None
+    ) -> None:
         self._conn = conn
+        self._identity_map = identity_map if identity_map is not None else IdentityMap()
 
     @property
-    def connection(self) -> Connection:
+    def connection(self) -> Connection | LazyConnection:
         return self._conn
+
+    @property
+    def identity_map(self) -> IdentityMap:
+        return self._identity_map
@@ -0,0 +1,35 @@
+from app.db import statements
+from app.db.repositories.base import BaseRepository
+
+
+class MediaRepository(BaseRepository):
+    """ Репозиторий для работы с таблицей 'media' """
+
+    async def add_reference(self, digest: str, path: str) -> str:
+        """
+        Увеличивает кол-во ссылок на файл на 1, создавая запись с path при необходимости.
+        Возвращает путь из записи: у уже сохранённого содержимого он может отличаться от path
+        """
+        return await self.connection.fetchval(statements.MEDIA_ADD_REFERENCE, digest, path)
+
+    async def remove_references(self, digests: list[str]) -> list[str]:
+        """
+        Уменьшает кол-во ссылок на файлы (хеш может повторяться),
+        удаляет записи без ссылок и возвращает пути их файлов
+        """
+        async with self.connection.transaction():
+            await self.connection.execute(statements.MEDIA_RELEASE_REFERENCES, digests)
+            media_db = await self.connection.fetch(statements.MEDIA_DELETE_UNREFERENCED, digests)
+            return [media[0] for media in media_db]
+
+    async def lock(self, digests: list[str]) -> None:
+        """
+        Блокирует хеши до конца транзакции: пока хеш заблокирован, другой процесс
+        не добавит на него ссылку и не удалит его файл
+        """
+        await self.connection.execute(statements.MEDIA_LOCK, digests)
+
+    async def get_existing(self, digests: list[str]) -> set[str]:
+        """ Хеши, для которых есть записи в 'media' """
+        media_db = await self.connection.fetch(statements.MEDIA_GET_EXISTING, digests)
+        return {media[0] for media in media_db}
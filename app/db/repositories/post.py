@@ -1,89 +1,145 @@
-import json
+from asyncpg import Record
 
+from app.db import statements
+from app.db.connection import read_only
 from app.db.errors import EntityDoesNotExist
 from app.db.repositories.base import BaseRepository
-from app.db.schemas.post import PostCreate, Post, PostLikeCount
+from app.db.schemas.post import PostCreate, Post, PostLikeCount, PaginationDirection
 
 
 class PostRepository(BaseRepository):
-    """ Репозиторий для работы с таблицей 'posts' """
+    """
+    Репозиторий для работы с таблицей 'posts'.
+    validate_records включается при posts_serialization=validated: посты из строк
+    запроса тогда проходят валидацию схемы, как до быстрой сериализации
+    """
 
+    validate_records = False
+
+    @read_only
     async def get_all(self, page: int = 1, limit: int = 5) -> list[Post]:
         """ Возвращает все посты """
-        posts_db = await self.connection.fetch(
-            "SELECT id, text, files, link, preview, author_id, like_count FROM posts LIMIT $1 OFFSET $2",
-            limit, page * limit)
-        return [Post(
-            id=post[0],
-            text=post[1],
-            files=post[2],
-            link=post[3],
-            preview=json.loads(post[4]),
-            author_id=post[5],
-            like_count=post[6]
-        )
-            for post in posts_db
-        ]
+        posts_db = await self.connection.fetch(statements.POST_GET_PAGE, limit, page * limit)
+        return [_post_from_record(post, self.validate_records) for post in posts_db]
+
+    @read_only
+    async def get_all_by_cursor(
+            self,
+            cursor: int,
+            limit: int = 5,
+            direction: PaginationDirection = PaginationDirection.after
+    ) -> list[Post]:
+        """
+        Возвращает посты после или до поста с id = cursor (keyset pagination).
+        Использует индекс первичного ключа, поэтому не зависит от глубины страницы
+        """
+        if direction == PaginationDirection.after:
+            posts_db = await self.connection.fetch(statements.POST_GET_AFTER, cursor, limit)
+        else:
+            posts_db = await self.connection.fetch(statements.POST_GET_BEFORE, cursor, limit)
+            posts_db = list(reversed(posts_db))
+        return [_post_from_record(post, self.validate_records) for post in posts_db]
 
+    @read_only
     async def get_by_id(self, post_id: int) -> Post:
-        """Получает пост по id"""
-        post_db = await self.connection.fetchrow(
-            """SELECT id, text, files, link, preview, author_id, like_count
-                    FROM posts
-                    WHERE id = $1""", post_id)
+        """Получает пост по id, повторно в рамках запроса - из identity map"""
+        post = self.identity_map.get(Post, post_id)
+        if post is not None:
+            return post
+        post_db = await self.connection.fetchrow(statements.POST_GET_BY_ID, post_id)
         if post_db:
-            return Post(
-                id=post_db[0],
-                text=post_db[1],
-                files=post_db[2],
-                link=post_db[3],
-                preview=json.loads(post_db[4]),
-                author_id=post_db[5],
-                like_count=post_db[6],
-            )
+            post = _post_from_record(post_db, self.validate_records)
+            self.identity_map.add(Post, post_id, post)
+            return post
         raise EntityDoesNotExist(f"Post by id {post_id} does not exist")
 
+    @read_only
     async def get_users_like_post(self, post_id: int, user_id: int) -> int | None:
         """ Получает пост по id c лайкнувшими пользователями"""
-        user_likes = await self.connection.fetchval(
-            """SELECT user_id FROM like_users WHERE post_id = $1 AND user_id = $2""", post_id, user_id)
+        user_likes = await self.connection.fetchval(statements.POST_GET_USER_LIKE, post_id, user_id)
         return user_likes
 
     async def add(self, post: PostCreate, author_id: int) -> Post:
         """ Добавление сообщения """
         async with self.connection.transaction():
             post_db = await self.connection.fetchrow(
-                "INSERT INTO posts (text, files, link, preview, author_id) VALUES($1, $2, $3, $4, $5) RETURNING *",
-                post.text, post.files, post.link, json.dumps(post.preview), author_id)
-            return Post(
-                id=post_db[0],
-                text=post_db[1],
-                files=post_db[2],
-                link=post_db[3],
-                preview=json.loads(post_db[4]),
-                like_count=post_db[5],
-                author_id=post_db[6]
-            )
+                statements.POST_ADD,
+                post.text, post.files, post.link, post.preview, author_id)
+            post = _post_from_record(post_db, self.validate_records)
+            self.identity_map.add(Post, post.id, post)
+            return post
+
+    async def update_preview(self, post_id: int, preview: dict) -> bool:
+        """
+        Обновляет preview поста, ожидающего загрузки, False если пост уже удалён
+        или его preview уже записан другим воркером
+        """
+        self.identity_map.discard(Post, post_id)
+        updated_id = await self.connection.fetchval(
+            statements.POST_UPDATE_PREVIEW, post_id, preview)
+        return updated_id is not None
+
+    async def get_pending_previews(self, after_id: int, limit: int) -> list[tuple[int, str]]:
+        """ Посты с preview в статусе pending и id больше after_id: пары (id, ссылка) """
+        records = await self.connection.fetch(statements.POST_GET_PENDING_PREVIEWS, after_id, limit)
+        return [(record["id"], record["link"]) for record in records]
+
+    async def toggle_like(self, post_id: int, user_id: int) -> PostLikeCount:
+        """
+        Ставит или снимает лайк пользователя одним запросом и возвращает новое кол-во лайков.
+        Нажатия одного пользователя на один пост выполняются по очереди под advisory lock:
+        иначе запрос, ждавший конкурента, не увидел бы его лайк и одно нажатие потерялось бы
+        """
+        self.identity_map.discard(Post, post_id)
+        async with self.connection.transaction():
+            await self.connection.execute(statements.POST_LOCK_LIKE, post_id, user_id)
+            like_count = await self.connection.fetchval(statements.POST_TOGGLE_LIKE, post_id, user_id)
+        if like_count is None:
+            raise EntityDoesNotExist(f"Post by id {post_id} does not exist")
+        return PostLikeCount(like_count=like_count)
 
     async def add_like(self, post_id: int, user_id: int) -> PostLikeCount:
         """ Увеличивает кол-во лайков на 1 """
+        self.identity_map.discard(Post, post_id)
         async with self.connection.transaction():
-            await self.connection.execute(
-                "INSERT INTO like_users (user_id, post_id) VALUES ($1, $2)", user_id, post_id)
-            like_count = await self.connection.fetchval(
-                "UPDATE posts SET like_count = like_count + 1 WHERE id = $1 RETURNING like_count", post_id)
+            await self.connection.execute(statements.POST_INSERT_LIKE, user_id, post_id)
+            like_count = await self.connection.fetchval(statements.POST_INCREMENT_LIKES, post_id)
             return PostLikeCount(like_count=like_count)
 
     async def remove_like(self, post_id: int, user_id: int) -> PostLikeCount:
         """ Уменьшает кол-во лайков на 1"""
+        self.identity_map.discard(Post, post_id)
         async with self.connection.transaction():
-            await self.connection.execute(
-                "DELETE FROM like_users WHERE post_id = $1 AND user_id = $2", post_id, user_id)
-            like_count = await self.connection.fetchval(
-                "UPDATE posts SET like_count = like_count - 1 WHERE id = $1 RETURNING like_count", post_id)
+            await self.connection.execute(statements.POST_DELETE_LIKE, post_id, user_id)
+            like_count = await self.connection.fetchval(statements.POST_DECREMENT_LIKES, post_id)
             return PostLikeCount(like_count=like_count)
 
     async def delete(self, post_id: int) -> None:
         """ Удаление сообщения """
+        self.identity_map.discard(Post, post_id)
         async with self.connection.transaction():
-            await self.connection.execute("DELETE FROM posts WHERE id = $1", post_id)
+            await self.connection.execute(statements.POST_DELETE, post_id)
+
+
+def _post_from_record(record: Record, validate: bool = False) -> Post:
+    """
+    Пост из строки запроса. Без validate повторной валидации нет: типы колонок
+    уже соответствуют схеме, а preview разобран кодеком jsonb
+    """
+    if validate:
+        post = Post(**record)
+        post._version = record["version"]
+        post._updated_at = record["updated_at"]
+        return post
+    post = Post.construct(
+        id=record[0],
+        text=record[1],
+        files=record[2],
+        link=record[3],
+        preview=record[4],
+        author_id=record[5],
+        like_count=record[6]
+    )
+    post._version = record[7]
+    post._updated_at = record[8]
+    return post
@@ -1,3 +1,8 @@
+from asyncpg import UniqueViolationError
+
+from app.db import statements
+from app.db.connection import read_only
+from app.db.errors import EntityAlreadyExists
 from app.db.repositories.base import BaseRepository
 from app.db.schemas.user import UserCreate, UserBase, UserDB
 
@@ -5,24 +10,31 @@ from app.db.schemas.user import UserCreate, UserBase, UserDB
 class UserRepository(BaseRepository):
     """ Репозиторий для работы с таблицей 'users' """
 
+    @read_only
     async def get_by_username(self, username: str) -> UserDB:
-        """ Получает пользователя по username """
-        user_db = await self.connection.fetchrow(
-            "SELECT id, username, hashed_password FROM users WHERE username = $1", username)
+        """ Получает пользователя по username, повторно в рамках запроса - из identity map """
+        user = self.identity_map.get(UserDB, username)
+        if user is not None:
+            return user
+        user_db = await self.connection.fetchrow(statements.USER_GET_BY_USERNAME, username)
         if user_db:
-            return UserDB(id=user_db[0], username=user_db[1], password=user_db[2])
+            user = UserDB(id=user_db[0], username=user_db[1], password=user_db[2])
+            self.identity_map.add(UserDB, username, user)
+            return user
 
+    @read_only
     async def get_by_id(self, user_id: int) -> UserBase:
         """ Получает пользователя по id """
-        user_db = await self.connection.fetchrow(
-            "SELECT id, username FROM users WHERE id = $1", user_id)
+        user_db = await self.connection.fetchrow(statements.USER_GET_BY_ID, user_id)
         if user_db:
             return UserBase(id=user_db[0], username=user_db[1])
 
     async def add(self, user: UserCreate) -> UserBase:
-        """ Добавляет пользователя """
-        async with self.connection.transaction():
-            user_db = await self.connection.fetchrow(
-                "INSERT INTO users (username, hashed_password) VALUES ($1, $2) RETURNING id, username;",
-                user.username, user.password)
-            return UserBase(id=user_db[0], username=user_db[1])
+        """ Добавляет пользователя, EntityAlreadyExists если username уже занят """
+        try:
+            async with self.connection.transaction():
+                user_db = await self.connection.fetchrow(
+                    statements.USER_ADD, user.username, user.password)
+        except UniqueViolationError:
+            raise EntityAlreadyExists(f"User {user.username} already exists")
+        return UserBase(id=user_db[0], username=user_db[1])
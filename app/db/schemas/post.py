@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel, PrivateAttr
 
 
 class Post(BaseModel):
@@ -10,6 +13,10 @@ class Post(BaseModel):
     author_id: int
     like_count: int
 
+    # версия поста для ETag и время изменения для Last-Modified, в ответ не попадают
+    _version: int = PrivateAttr(default=0)
+    _updated_at: datetime | None = PrivateAttr(default=None)
+
     class Config:
         orm_mode = True
         schema_extra = {
@@ -39,13 +46,23 @@ class PostLikeCount(BaseModel):
         }
 
 
+class PaginationDirection(str, Enum):
+    """ Направление курсорной навигации относительно курсора """
+    after = "after"
+    before = "before"
+
+
 class ListOfPostsInResponse(BaseModel):
     posts: list[Post]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
 
     class Config:
         schema_extra = {
             'example': {
-                'posts': [Post.Config.schema_extra.get("example")]
+                'posts': [Post.Config.schema_extra.get("example")],
+                'next_cursor': "MQ",
+                'prev_cursor': "NQ"
             }
         }
 
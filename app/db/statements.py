@@ -0,0 +1,189 @@
+"""
+Реестр именованных SQL запросов репозиториев.
+Все запросы реестра подготавливаются на каждом новом соединении пула
+(см. AppConnection) и выполняются готовым планом без повторного разбора
+"""
+from typing import Iterator
+
+
+class Statement(str):
+    """ Текст SQL запроса с именем, под которым он подготовлен на соединении """
+
+    name: str
+
+    def __new__(cls, name: str, sql: str) -> "Statement":
+        statement = super().__new__(cls, sql)
+        statement.name = name
+        return statement
+
+
+class StatementRegistry:
+    """ Именованные запросы, которые подготавливаются при открытии соединения """
+
+    def __init__(self) -> None:
+        self._statements: dict[str, Statement] = {}
+
+    def __iter__(self) -> Iterator[Statement]:
+        return iter(self._statements.values())
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def register(self, name: str, sql: str) -> Statement:
+        """ Добавляет запрос в реестр, имена запросов не должны повторяться """
+        if name in self._statements:
+            raise ValueError(f"Statement {name} is already registered")
+        statement = Statement(name, sql)
+        self._statements[name] = statement
+        return statement
+
+
+registry = StatementRegistry()
+
+# posts
+
+POST_GET_PAGE = registry.register(
+    "post.get_page",
+    """SELECT id, text, files, link, preview, author_id, like_count, version, updated_at
+            FROM posts
+            ORDER BY id DESC
+            LIMIT $1 OFFSET $2""")
+
+POST_GET_AFTER = registry.register(
+    "post.get_after",
+    """SELECT id, text, files, link, preview, author_id, like_count, version, updated_at
+            FROM posts
+            WHERE id < $1
+            ORDER BY id DESC
+            LIMIT $2""")
+
+POST_GET_BEFORE = registry.register(
+    "post.get_before",
+    """SELECT id, text, files, link, preview, author_id, like_count, version, updated_at
+            FROM posts
+            WHERE id > $1
+            ORDER BY id ASC
+            LIMIT $2""")
+
+POST_GET_BY_ID = registry.register(
+    "post.get_by_id",
+    """SELECT id, text, files, link, preview, author_id, like_count, version, updated_at
+            FROM posts
+            WHERE id = $1""")
+
+POST_GET_USER_LIKE = registry.register(
+    "post.get_user_like",
+    "SELECT user_id FROM like_users WHERE post_id = $1 AND user_id = $2")
+
+POST_ADD = registry.register(
+    "post.add",
+    """INSERT INTO posts (text, files, link, preview, author_id) VALUES ($1, $2, $3, $4, $5)
+            RETURNING id, text, files, link, preview, author_id, like_count, version, updated_at""")
+
+POST_UPDATE_PREVIEW = registry.register(
+    "post.update_preview",
+    """UPDATE posts SET preview = $2, version = version + 1, updated_at = now()
+            WHERE id = $1 AND preview->>'status' = 'pending'
+            RETURNING id""")
+
+POST_GET_PENDING_PREVIEWS = registry.register(
+    "post.get_pending_previews",
+    """SELECT id, link
+            FROM posts
+            WHERE preview->>'status' = 'pending' AND id > $1
+            ORDER BY id
+            LIMIT $2""")
+
+# ключ из одного bigint (post_id, user_id) не пересекается с двухключевыми блокировками media,
+# id в like_users помещаются в INTEGER
+POST_LOCK_LIKE = registry.register(
+    "post.lock_like",
+    "SELECT pg_advisory_xact_lock(($1::bigint << 32) | $2::bigint)")
+
+POST_TOGGLE_LIKE = registry.register(
+    "post.toggle_like",
+    """WITH deleted AS (
+            DELETE FROM like_users WHERE post_id = $1 AND user_id = $2
+            RETURNING 1
+        ), inserted AS (
+            INSERT INTO like_users (user_id, post_id)
+            SELECT $2, $1 WHERE NOT EXISTS (SELECT 1 FROM deleted)
+            ON CONFLICT (post_id, user_id) DO NOTHING
+            RETURNING 1
+        )
+        UPDATE posts
+            SET like_count = like_count
+                    + (SELECT count(*) FROM inserted)
+                    - (SELECT count(*) FROM deleted),
+                version = version + 1,
+                updated_at = now()
+            WHERE id = $1
+            RETURNING like_count""")
+
+POST_INSERT_LIKE = registry.register(
+    "post.insert_like",
+    "INSERT INTO like_users (user_id, post_id) VALUES ($1, $2)")
+
+POST_DELETE_LIKE = registry.register(
+    "post.delete_like",
+    "DELETE FROM like_users WHERE post_id = $1 AND user_id = $2")
+
+POST_INCREMENT_LIKES = registry.register(
+    "post.increment_likes",
+    """UPDATE posts SET like_count = like_count + 1, version = version + 1, updated_at = now()
+            WHERE id = $1
+            RETURNING like_count""")
+
+POST_DECREMENT_LIKES = registry.register(
+    "post.decrement_likes",
+    """UPDATE posts SET like_count = like_count - 1, version = version + 1, updated_at = now()
+            WHERE id = $1
+            RETURNING like_count""")
+
+POST_DELETE = registry.register(
+    "post.delete",
+    "DELETE FROM posts WHERE id = $1")
+
+# users
+
+USER_GET_BY_USERNAME = registry.register(
+    "user.get_by_username",
+    "SELECT id, username, hashed_password FROM users WHERE username = $1")
+
+USER_GET_BY_ID = registry.register(
+    "user.get_by_id",
+    "SELECT id, username FROM users WHERE id = $1")
+
+USER_ADD = registry.register(
+    "user.add",
+    "INSERT INTO users (username, hashed_password) VALUES ($1, $2) RETURNING id, username")
+
+# media
+
+MEDIA_ADD_REFERENCE = registry.register(
+    "media.add_reference",
+    """INSERT INTO media (hash, path, ref_count) VALUES ($1, $2, 1)
+            ON CONFLICT (hash) DO UPDATE SET ref_count = media.ref_count + 1
+            RETURNING path""")
+
+MEDIA_RELEASE_REFERENCES = registry.register(
+    "media.release_references",
+    """UPDATE media SET ref_count = media.ref_count - refs.count
+            FROM (SELECT hash, count(*) AS count
+                    FROM unnest($1::text[]) AS hash
+                    GROUP BY hash) AS refs
+            WHERE media.hash = refs.hash""")
+
+MEDIA_DELETE_UNREFERENCED = registry.register(
+    "media.delete_unreferenced",
+    "DELETE FROM media WHERE hash = ANY($1::text[]) AND ref_count <= 0 RETURNING path")
+
+# первый ключ отделяет блокировки хешей media от других advisory lock приложения
+MEDIA_LOCK = registry.register(
+    "media.lock",
+    """SELECT pg_advisory_xact_lock(7336202, hashtext(hash))
+            FROM (SELECT DISTINCT hash FROM unnest($1::text[]) AS hash ORDER BY hash) AS hashes""")
+
+MEDIA_GET_EXISTING = registry.register(
+    "media.get_existing",
+    "SELECT hash FROM media WHERE hash = ANY($1::text[])")
@@ -0,0 +1,124 @@
+import copy
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
+from typing import Literal
+
+from app import metrics
+
+_BASE_FORMATTER = logging.Formatter()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Передаёт записи в ограниченную очередь, из которой их пишет QueueListener в отдельном потоке.
+    При заполненной очереди policy=drop сразу отбрасывает запись, policy=block ждёт
+    не больше block_timeout секунд и тоже отбрасывает. Число отброшенных записей
+    попадает в метрику log_records_dropped_total и в предупреждение, как только в очереди есть место
+    """
+
+    def __init__(
+            self,
+            log_queue: queue.Queue,
+            policy: Literal["drop", "block"],
+            block_timeout: float
+    ) -> None:
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Подставляет аргументы в сообщение и превращает исключение в текст,
+        форматирование остаётся обработчикам потока записи
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _BASE_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if not self._put(record):
+            self.dropped += 1
+            metrics.log_records_dropped.inc()
+            return
+        if self.dropped > self._reported:
+            lost = self.dropped - self._reported
+            self._reported = self.dropped
+            self._put(logging.makeLogRecord({
+                "name": record.name,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"Очередь логов переполнена, отброшено записей: {lost}",
+            }))
+
+    def _put(self, record: logging.LogRecord) -> bool:
+        try:
+            if self.policy == "block":
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            return False
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает записи с исключениями: из одного места кода с одним типом исключения
+    проходят не больше burst записей за interval секунд. Первая запись следующего
+    интервала сообщает, сколько похожих записей было пропущено
+    """
+
+    def __init__(self, burst: int, interval: float) -> None:
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # ключ -> [начало интервала, пропущено в интервале, отброшено]
+        self._windows: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not record.exc_info:
+            return True
+        key = (record.pathname, record.lineno, record.exc_info[0])
+        window = self._windows.get(key)
+        if window is None or record.created - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            self._windows[key] = [record.created, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} (похожих записей пропущено: {suppressed})"
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """ Одна запись - одна строка JSON """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
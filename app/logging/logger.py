@@ -1,6 +1,56 @@
-import logging.config
+import atexit
+import logging
+import queue
+from logging.handlers import QueueListener
 
-from app.logging.logging_config import dict_config
+from app.config import AppSettings, get_app_settings
+from app.logging.handlers import BoundedQueueHandler, RateLimitFilter
+from app.logging.logging_config import build_handlers
 
-logging.config.dictConfig(dict_config)
 logger = logging.getLogger('main')
+
+_listener: QueueListener | None = None
+
+
+def setup_logging(settings: AppSettings | None = None) -> None:
+    """
+    Настраивает логирование, вызывается при создании приложения, а не при импорте.
+    Логгер main только кладёт записи в ограниченную очередь, в консоль и файл
+    их пишет отдельный поток QueueListener, поэтому event loop не ждёт дискового ввода-вывода
+    """
+    global _listener
+    settings = settings or get_app_settings()
+    stop_logging()
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    queue_handler = BoundedQueueHandler(
+        log_queue,
+        policy=settings.log_queue_policy,
+        block_timeout=settings.log_queue_block_timeout_seconds
+    )
+    queue_handler.addFilter(RateLimitFilter(
+        burst=settings.log_exception_burst,
+        interval=settings.log_exception_interval_seconds
+    ))
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers = [queue_handler]
+    logger.setLevel(settings.log_level)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, *build_handlers(settings), respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """ Дописывает записи из очереди и останавливает поток записи логов """
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+atexit.register(stop_logging)
@@ -1,34 +1,30 @@
-dict_config = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'base': {
-            'format': '%(levelname)s | %(name)s | %(funcName)s | %(asctime)s | %(lineno)d | %(message)s',
-        }
-    },
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'level': 'DEBUG',
-            'formatter': 'base',
-        },
-        'file': {
-            "class": "logging.handlers.TimedRotatingFileHandler",
-            "when": "midnight",
-            "backupCount": 7,
-            "formatter": "base",
-            "level": "DEBUG",
-            "filename": "app/logging/logs/logs.log"
-        }
-    },
-    'loggers': {
-        'main': {
-            'level': 'DEBUG',
-            'handlers': ['console', 'file'],
-        },
-    },
-    'root': {
-        'level': 'DEBUG',
-        'handlers': [],
-    }
-}
\ No newline at end of file
+import logging
+from logging.handlers import TimedRotatingFileHandler
+from pathlib import Path
+
+from app.config import AppSettings
+from app.logging.handlers import JsonFormatter
+
+BASE_FORMAT = '%(levelname)s | %(name)s | %(funcName)s | %(asctime)s | %(lineno)d | %(message)s'
+
+
+def build_formatter(settings: AppSettings) -> logging.Formatter:
+    if settings.log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter(BASE_FORMAT)
+
+
+def build_handlers(settings: AppSettings) -> list[logging.Handler]:
+    """ Обработчики, которые пишут логи в потоке QueueListener: консоль и файл с ротацией в полночь """
+    formatter = build_formatter(settings)
+    console = logging.StreamHandler()
+    console.setLevel(settings.log_console_level)
+    console.setFormatter(formatter)
+    handlers: list[logging.Handler] = [console]
+    if settings.log_file:
+        Path(settings.log_file).parent.mkdir(parents=True, exist_ok=True)
+        file = TimedRotatingFileHandler(settings.log_file, when="midnight", backupCount=7, delay=True)
+        file.setLevel(settings.log_file_level)
+        file.setFormatter(formatter)
+        handlers.append(file)
+    return handlers
@@ -1,13 +1,17 @@
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from app.api.metrics.endpoints import metrics_router
+from app.api.middleware import MetricsMiddleware, ProfilingMiddleware, ReadYourWritesMiddleware
 from app.api.routes import router
 from app.config import get_app_settings
 from app.db.events import create_start_app_handler, create_stop_app_handler
+from app.logging.logger import setup_logging
 
 
 def get_application():
     settings = get_app_settings()
+    setup_logging(settings)
 
     application = FastAPI(**settings.fastapi_kwargs)
 
@@ -19,6 +23,25 @@ def get_application():
         allow_headers=["*"],
     )
 
+    if settings.postgres_replica_dsns and settings.read_your_writes_seconds > 0:
+        application.add_middleware(
+            ReadYourWritesMiddleware,
+            window_seconds=settings.read_your_writes_seconds,
+            secret_key=settings.access_secret_key.get_secret_value(),
+            exclude_paths=(f"{settings.api_prefix}/auth/",),
+        )
+
+    if settings.metrics_enabled:
+        application.add_middleware(MetricsMiddleware)
+        application.include_router(metrics_router, include_in_schema=False)
+
+    if settings.profiling_sample_rate > 0:
+        application.add_middleware(
+            ProfilingMiddleware,
+            sample_rate=settings.profiling_sample_rate,
+            slow_request_ms=settings.profiling_slow_request_ms,
+        )
+
     application.add_event_handler(
         "startup",
         create_start_app_handler(application, settings),
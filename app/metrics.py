@@ -0,0 +1,226 @@
+"""
+Метрики воркера в текстовом формате Prometheus: счётчики, gauge и гистограммы.
+Метрики обновляются только из event loop, поэтому обходятся без блокировок:
+серия меток находится один раз, наблюдение - это bisect и несколько сложений.
+Значения хранятся в памяти процесса и между воркерами не суммируются: каждый воркер
+отдаёт на /metrics только свои метрики и должен быть отдельной целью сбора Prometheus
+"""
+import abc
+import bisect
+import functools
+import math
+import time
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    labels = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+        yield from self._samples()
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterator[str]:
+        """ Строки со значениями серий метрики """
+
+
+class Counter(_Metric):
+    """ Монотонно растущий счётчик """
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set_total(self, value: float, *labels: str) -> None:
+        """ Значение счётчика, который считается в другом объекте, например попадания TTLCache """
+        self._values[labels] = value
+
+    def _samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """ Текущее значение, обычно выставляется перед отдачей метрик """
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def _samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class HistogramSeries:
+    """ Одна серия меток гистограммы, счётчики корзин хранятся без накопления """
+
+    __slots__ = ("_buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self._buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """ Распределение значений по корзинам, например длительностей в секундах """
+
+    type_name = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: tuple[str, ...] = (),
+            buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], HistogramSeries] = {}
+
+    def labels(self, *labels: str) -> HistogramSeries:
+        """ Серия для значений меток, её можно сохранить и наблюдать без поиска по меткам """
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def _samples(self) -> Iterator[str]:
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series.sum)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series.count}"
+
+
+class MetricsRegistry:
+    """ Метрики воркера, которые отдаются эндпоинтом /metrics """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = [line for metric in self._metrics.values() for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+def timed_calls(
+        series: HistogramSeries,
+        func: Callable[..., Awaitable[T]]
+) -> Callable[..., Awaitable[T]]:
+    """ Оборачивает корутину, длительность каждого вызова попадает в серию гистограммы """
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> T:
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            series.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+registry = MetricsRegistry()
+
+http_request_duration: Histogram = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status")))
+
+db_pool_size: Gauge = registry.register(Gauge(
+    "db_pool_size", "Open connections in the asyncpg pool", ("pool",)))
+db_pool_idle: Gauge = registry.register(Gauge(
+    "db_pool_idle_connections", "Idle connections in the asyncpg pool", ("pool",)))
+db_pool_waiting: Gauge = registry.register(Gauge(
+    "db_pool_acquire_waiting", "Coroutines waiting to acquire a pool connection", ("pool",)))
+db_pool_acquire_duration: Histogram = registry.register(Histogram(
+    "db_pool_acquire_duration_seconds", "Time spent waiting for a pool connection", ("pool",)))
+
+repository_call_duration: Histogram = registry.register(Histogram(
+    "repository_call_duration_seconds", "Repository method latency", ("repository", "method")))
+
+preview_fetches: Counter = registry.register(Counter(
+    "preview_fetch_total", "Preview requests by outcome", ("outcome",)))
+background_queue_depth: Gauge = registry.register(Gauge(
+    "background_queue_depth", "Jobs waiting in background queues", ("queue",)))
+
+cache_entries: Gauge = registry.register(Gauge(
+    "cache_entries", "Entries in in-process caches", ("cache",)))
+cache_hits: Counter = registry.register(Counter(
+    "cache_hits_total", "In-process cache hits", ("cache",)))
+cache_misses: Counter = registry.register(Counter(
+    "cache_misses_total", "In-process cache misses", ("cache",)))
+cache_evictions: Counter = registry.register(Counter(
+    "cache_evictions_total", "In-process cache evictions by size", ("cache",)))
+post_cache_coalesced: Counter = registry.register(Counter(
+    "post_cache_coalesced_total", "Post cache misses served by another in-flight load"))
+post_cache_invalidations: Counter = registry.register(Counter(
+    "post_cache_invalidations_total", "Post cache invalidations by local writes and notifications"))
+post_cache_listening: Gauge = registry.register(Gauge(
+    "post_cache_listening", "1 while the post cache receives invalidation notifications"))
+
+log_records_dropped: Counter = registry.register(Counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full"))
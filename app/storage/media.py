@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import os
+import re
+from typing import AsyncIterator
+from uuid import uuid4
+
+import aiofiles
+
+from app.db.repositories.media import MediaRepository
+
+EXTENSIONS = {
+    "image": ".png",
+    "video": ".mp4",
+}
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class MediaTooLarge(Exception):
+    """ Возникает, когда media файл превышает допустимый размер """
+
+
+class MediaStorage:
+    """
+    Контентно-адресуемое хранилище media файлов.
+    Файл хранится один раз по пути, производному от sha256 его содержимого:
+    <root>/<kind>/<hash[:2]>/<hash[2:4]>/<hash>.<ext>. Путь выбирается при первой
+    загрузке содержимого и хранится в таблице 'media' вместе с кол-вом ссылок,
+    те же байты, загруженные с другим kind, ссылаются на уже сохранённый файл.
+    Файл удаляется после фиксации транзакции, снявшей последнюю ссылку. Добавление ссылки
+    и удаление файла выполняются под advisory lock хеша, поэтому не пересекаются
+    """
+
+    def __init__(self, root: str, max_file_size: int | None = None) -> None:
+        self.root = root
+        self.max_file_size = max_file_size
+        self._tmp_dir = os.path.join(root, "tmp")
+
+    def path_for(self, digest: str, kind: str) -> str:
+        """ Путь к файлу в хранилище по хешу содержимого """
+        return os.path.join(
+            self.root, kind, digest[:2], digest[2:4], f"{digest}{EXTENSIONS[kind]}"
+        )
+
+    @staticmethod
+    def digest_from_path(path: str) -> str | None:
+        """ Хеш содержимого из пути файла, None для файлов вне хранилища """
+        digest = os.path.splitext(os.path.basename(path))[0]
+        return digest if _DIGEST_RE.match(digest) else None
+
+    async def put(
+            self,
+            chunks: AsyncIterator[bytes],
+            kind: str,
+            media_repo: MediaRepository
+    ) -> str:
+        """
+        Сохраняет поток байт, вычисляя хеш во время записи, и добавляет ссылку на файл.
+        Если такое содержимое уже хранится, новая копия не создаётся
+        """
+        digest, tmp_path = await self._spool(chunks)
+        try:
+            return await self._store(digest=digest, kind=kind, tmp_path=tmp_path, media_repo=media_repo)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def put_file(self, fd: int, kind: str, media_repo: MediaRepository) -> str:
+        """
+        Сохраняет файл, который уже лежит на диске, например временный файл загрузки Starlette.
+        Хеш считается, а содержимое копируется ядром через sendfile в отдельном потоке
+        """
+        digest, tmp_path = await asyncio.to_thread(self._spool_descriptor, fd)
+        try:
+            return await self._store(digest=digest, kind=kind, tmp_path=tmp_path, media_repo=media_repo)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def reference(self, path: str, media_repo: MediaRepository) -> bool:
+        """ Добавляет ссылку на уже сохранённый файл, False если файла больше нет """
+        digest = self.digest_from_path(path)
+        if digest is None:
+            return False
+        async with media_repo.connection.transaction():
+            await media_repo.lock([digest])
+            stored_path = await media_repo.add_reference(digest=digest, path=path)
+            if os.path.exists(stored_path):
+                return True
+            # файл удалён, добавленная ссылка снимается вместе с записью без ссылок
+            await media_repo.remove_references(digests=[digest])
+        return False
+
+    async def release(self, paths: list[str], media_repo: MediaRepository) -> None:
+        """
+        Удаляет ссылки на файлы и сами файлы, на которые больше никто не ссылается.
+        Вызывается вне транзакции, внутри транзакции ссылки снимает release_references,
+        а файлы удаляет remove_files после её фиксации
+        """
+        removed = await self.release_references(paths=paths, media_repo=media_repo)
+        await self.remove_files(paths=removed, media_repo=media_repo)
+
+    async def release_references(self, paths: list[str], media_repo: MediaRepository) -> list[str]:
+        """ Удаляет ссылки на файлы и возвращает пути файлов, на которые ссылок не осталось """
+        digests = [
+            digest for digest in map(self.digest_from_path, paths) if digest is not None
+        ]
+        if not digests:
+            return []
+        return await media_repo.remove_references(digests=digests)
+
+    async def remove_files(self, paths: list[str], media_repo: MediaRepository) -> None:
+        """
+        Удаляет файлы после фиксации транзакции, в которой сняты последние ссылки.
+        Если за это время то же содержимое загрузили снова, запись уже есть и файл остаётся
+        """
+        by_digest = {self.digest_from_path(path): path for path in paths}
+        by_digest.pop(None, None)
+        if not by_digest:
+            return
+        async with media_repo.connection.transaction():
+            await media_repo.lock(list(by_digest))
+            existing = await media_repo.get_existing(list(by_digest))
+            for digest, path in by_digest.items():
+                if digest in existing:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    async def _store(self, digest: str, kind: str, tmp_path: str, media_repo: MediaRepository) -> str:
+        """
+        Добавляет ссылку и переносит временный файл в хранилище в одной транзакции:
+        если файл не удалось перенести, ссылка не сохраняется
+        """
+        async with media_repo.connection.transaction():
+            await media_repo.lock([digest])
+            path = await media_repo.add_reference(digest=digest, path=self.path_for(digest, kind))
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        return path
+
+    async def _spool(self, chunks: AsyncIterator[bytes]) -> tuple[str, str]:
+        """ Пишет поток во временный файл, возвращает хеш содержимого и путь к файлу """
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(self._tmp_dir, str(uuid4()))
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as buffer:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if self.max_file_size is not None and size > self.max_file_size:
+                        raise MediaTooLarge(
+                            f"File is larger than {self.max_file_size} bytes"
+                        )
+                    sha256.update(chunk)
+                    await buffer.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return sha256.hexdigest(), tmp_path
+
+    def _spool_descriptor(self, fd: int) -> tuple[str, str]:
+        """ Копирует файл дескриптора во временный файл, возвращает хеш содержимого и путь к файлу """
+        size = os.fstat(fd).st_size
+        if self.max_file_size is not None and size > self.max_file_size:
+            raise MediaTooLarge(f"File is larger than {self.max_file_size} bytes")
+        sha256 = hashlib.sha256()
+        offset = 0
+        while chunk := os.pread(fd, _HASH_CHUNK_SIZE, offset):
+            sha256.update(chunk)
+            offset += len(chunk)
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(self._tmp_dir, str(uuid4()))
+        try:
+            with open(tmp_path, "wb") as buffer:
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(buffer.fileno(), fd, offset, size - offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return sha256.hexdigest(), tmp_path
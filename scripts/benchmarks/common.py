@@ -0,0 +1,103 @@
+"""
+Общие утилиты бенчмарков: нагрузка с фиксированной конкурентностью, перцентили
+и запуск приложения на свободном порту
+"""
+import asyncio
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+from aiohttp import ClientSession
+
+
+@dataclass
+class LoadResult:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def summary(self) -> dict[str, float]:
+        """ Пропускная способность и перцентили задержки в миллисекундах """
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "rps": count / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": percentile(self.latencies, 50) * 1000,
+            "p95_ms": percentile(self.latencies, 95) * 1000,
+            "p99_ms": percentile(self.latencies, 99) * 1000,
+            "max_ms": max(self.latencies, default=0.0) * 1000,
+        }
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """ Перцентиль методом ближайшего ранга """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def run_load(
+        session: ClientSession,
+        make_request: Callable[[ClientSession], Awaitable[bool]],
+        concurrency: int,
+        duration: float
+) -> LoadResult:
+    """
+    Выполняет make_request в concurrency параллельных воркерах в течение duration секунд.
+    make_request возвращает True при успешном ответе
+    """
+    result = LoadResult()
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = await make_request(session)
+            except Exception:
+                ok = False
+            if ok:
+                result.latencies.append(time.perf_counter() - started)
+            else:
+                result.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def print_summary(title: str, summary: dict[str, float]) -> None:
+    print(
+        f"{title:<28} rps={summary['rps']:>9.1f} "
+        f"p50={summary['p50_ms']:>8.2f}ms p95={summary['p95_ms']:>8.2f}ms "
+        f"p99={summary['p99_ms']:>8.2f}ms errors={summary['errors']}"
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_first_response(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"uvicorn exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status < 500:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    raise SystemExit(f"No response from {url} in {timeout} s")
@@ -0,0 +1,208 @@
+"""
+Нагрузочный прогон основных эндпоинтов с фиксированной конкурентностью:
+POST /auth/login, GET /posts/all, GET /posts/{id}, POST /posts/like/{id}, POST /posts/create.
+
+Приложение запускается uvicorn на свободном порту против бд из настроек приложения
+(локальный postgres, например docker-compose up db), миграции применяются при старте.
+Ссылки новых постов ведут на локальный сервер-заглушку со страницей с og-тегами и фото,
+поэтому получение preview не зависит от внешней сети:
+    python -m scripts.benchmarks.load --workers 1 --concurrency 32 --output load.json
+    python -m scripts.benchmarks.load --base-url http://127.0.0.1:8000 --scenario get_post
+
+Результаты пишутся в JSON вместе с параметрами прогона и коммитом, чтобы сравнивать
+прогоны между собой. По умолчанию у каждого нового поста своя ссылка и preview
+каждый раз загружается со страницы, --cached-links создаёт посты с одной ссылкой
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from aiohttp import ClientSession, FormData, web
+
+from scripts.benchmarks.common import free_port, print_summary, run_load, wait_first_response
+
+_PAGE = """<html><head>
+<meta property="og:description" content="Benchmark page {n}">
+<meta property="og:image" content="{image_url}">
+</head><body>{body}</body></html>"""
+# содержимое фото не проверяется, важен только размер загрузки
+_IMAGE = bytes(range(256)) * 64
+
+SCENARIOS = ("login", "get_all", "get_post", "like", "create")
+
+
+async def start_link_server(delay: float) -> tuple[web.AppRunner, str]:
+    """ Сервер-заглушка страниц для preview, delay - задержка ответа в секундах """
+    async def page(request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+        html = _PAGE.format(
+            n=request.query.get("n", ""),
+            image_url=request.url.with_path("/image.png").with_query(None),
+            body="<p>text</p>" * 200
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    async def image(request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+        return web.Response(body=_IMAGE, content_type="image/png")
+
+    app = web.Application()
+    app.router.add_get("/page", page)
+    app.router.add_get("/image.png", image)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def start_app(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {**os.environ, "MIGRATIONS_ON_STARTUP": "apply"}
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(port), "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_first_response(f"{base_url}/api/v1/posts/all?limit=1", process, args.timeout)
+    except BaseException:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+async def prepare(session: ClientSession, api: str, args: argparse.Namespace) -> tuple[dict, list[int]]:
+    """ Регистрирует пользователя, получает токен и создаёт посты, если их меньше --posts """
+    credentials = {"username": args.username, "password": args.password}
+    async with session.post(f"{api}/auth/registration", json=credentials) as response:
+        if response.status not in (201, 409):
+            raise SystemExit(f"Registration failed: {response.status}")
+    async with session.post(f"{api}/auth/login", json=credentials) as response:
+        if response.status != 200:
+            raise SystemExit(f"Login failed: {response.status}")
+        headers = {"Authorization": f"Bearer {(await response.json())['access_token']}"}
+
+    async def post_ids() -> list[int]:
+        async with session.get(f"{api}/posts/all", params={"limit": args.posts}) as response:
+            return [post["id"] for post in (await response.json())["posts"]]
+
+    ids = await post_ids()
+    for n in range(args.posts - len(ids)):
+        form = FormData({"text": f"benchmark post {n}"})
+        async with session.post(f"{api}/posts/create", data=form, headers=headers) as response:
+            if response.status != 201:
+                raise SystemExit(f"Post creation failed: {response.status}")
+    return headers, ids if len(ids) >= args.posts else await post_ids()
+
+
+def scenario_requests(
+        api: str,
+        link_url: str,
+        credentials: dict,
+        headers: dict,
+        ids: list[int],
+        args: argparse.Namespace
+) -> dict[str, Callable[[ClientSession], Awaitable[bool]]]:
+    counter = itertools.count()
+
+    async def request(session: ClientSession, method: str, url: str, expected: int, **kwargs) -> bool:
+        async with session.request(method, url, **kwargs) as response:
+            await response.read()
+            return response.status == expected
+
+    async def create(session: ClientSession) -> bool:
+        n = 0 if args.cached_links else next(counter)
+        form = FormData({"text": "benchmark post", "link": f"{link_url}/page?n={n}"})
+        return await request(session, "POST", f"{api}/posts/create", 201, data=form, headers=headers)
+
+    return {
+        "login": lambda session: request(session, "POST", f"{api}/auth/login", 200, json=credentials),
+        "get_all": lambda session: request(
+            session, "GET", f"{api}/posts/all", 200, params={"limit": args.limit}),
+        "get_post": lambda session: request(session, "GET", f"{api}/posts/{random.choice(ids)}", 200),
+        "like": lambda session: request(
+            session, "POST", f"{api}/posts/like/{random.choice(ids)}", 201, headers=headers),
+        "create": create,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace, base_url: str) -> dict:
+    api = f"{base_url}/api/v1"
+    credentials = {"username": args.username, "password": args.password}
+    runner, link_url = await start_link_server(args.link_delay_ms / 1000)
+    try:
+        async with ClientSession() as session:
+            headers, ids = await prepare(session, api, args)
+            requests = scenario_requests(api, link_url, credentials, headers, ids, args)
+            results = {}
+            for name in args.scenario:
+                await run_load(session, requests[name], args.concurrency, args.warmup)
+                summary = (await run_load(session, requests[name], args.concurrency, args.duration)).summary()
+                print_summary(name, summary)
+                results[name] = summary
+    finally:
+        await runner.cleanup()
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "password")},
+        "scenarios": results,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_app(args)
+    try:
+        report = asyncio.run(run(args, base_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="benchmark an already running app instead of starting one")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="scenario to run, may be repeated; all by default")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--limit", type=int, default=20, help="page size for /posts/all")
+    parser.add_argument("--posts", type=int, default=100, help="posts to create before the run")
+    parser.add_argument("--cached-links", action="store_true", help="create posts with the same link")
+    parser.add_argument("--link-delay-ms", type=float, default=0.0, help="latency of the stub link server")
+    parser.add_argument("--username", default="benchmark")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    arguments = parser.parse_args()
+    arguments.scenario = arguments.scenario or list(SCENARIOS)
+    main(arguments)
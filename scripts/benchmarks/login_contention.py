@@ -0,0 +1,57 @@
+"""
+p99 задержки GET /posts/{id} пока параллельно идут логины.
+
+Запуск против работающего приложения:
+    python -m scripts.benchmarks.login_contention --base-url http://127.0.0.1 --post-id 1
+
+Сначала измеряются чтения без нагрузки, затем те же чтения вместе с потоком логинов.
+Если bcrypt блокирует event loop, p99 во второй фазе вырастет на сотни миллисекунд
+"""
+import argparse
+import asyncio
+
+from aiohttp import ClientSession
+
+from scripts.benchmarks.common import print_summary, run_load
+
+
+async def main(args: argparse.Namespace) -> None:
+    api = f"{args.base_url}/api/v1"
+    credentials = {"username": args.username, "password": args.password}
+
+    async def get_post(session: ClientSession) -> bool:
+        async with session.get(f"{api}/posts/{args.post_id}") as response:
+            await response.read()
+            return response.status == 200
+
+    async def login(session: ClientSession) -> bool:
+        async with session.post(f"{api}/auth/login", json=credentials) as response:
+            await response.read()
+            return response.status == 200
+
+    async with ClientSession() as session:
+        async with session.post(f"{api}/auth/registration", json=credentials) as response:
+            if response.status not in (201, 409):
+                raise SystemExit(f"Registration failed: {response.status}")
+
+        baseline = await run_load(session, get_post, args.read_concurrency, args.duration)
+        print_summary("GET /posts/{id}", baseline.summary())
+
+        reads, logins = await asyncio.gather(
+            run_load(session, get_post, args.read_concurrency, args.duration),
+            run_load(session, login, args.login_concurrency, args.duration),
+        )
+        print_summary("GET /posts/{id} + logins", reads.summary())
+        print_summary("POST /auth/login", logins.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1")
+    parser.add_argument("--post-id", type=int, required=True)
+    parser.add_argument("--username", default="benchmark")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--read-concurrency", type=int, default=4)
+    parser.add_argument("--login-concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
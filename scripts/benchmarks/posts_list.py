@@ -0,0 +1,53 @@
+"""
+Запросов в секунду на один воркер для GET /posts/all?limit=100.
+
+Приложение запускается с одним воркером дважды: с прежней сериализацией
+(Post(**record) в репозитории и валидация response_model) и с быстрой,
+затем бенчмарк запускается против каждого:
+    POSTS_SERIALIZATION=validated uvicorn app.main:app --workers 1
+    python -m scripts.benchmarks.posts_list --label validated
+
+    POSTS_SERIALIZATION=fast uvicorn app.main:app --workers 1
+    python -m scripts.benchmarks.posts_list --label fast
+
+В бд должно быть не меньше limit постов, иначе ответ будет короче
+"""
+import argparse
+import asyncio
+
+from aiohttp import ClientSession
+
+from scripts.benchmarks.common import print_summary, run_load
+
+
+async def main(args: argparse.Namespace) -> None:
+    url = f"{args.base_url}/api/v1/posts/all?limit={args.limit}"
+
+    async def get_posts(session: ClientSession) -> bool:
+        async with session.get(url) as response:
+            await response.read()
+            return response.status == 200
+
+    async with ClientSession() as session:
+        async with session.get(url) as response:
+            posts = (await response.json())["posts"]
+            if len(posts) < args.limit:
+                print(f"warning: only {len(posts)} posts returned, expected {args.limit}")
+
+        await run_load(session, get_posts, args.concurrency, args.warmup)
+        result = await run_load(session, get_posts, args.concurrency, args.duration)
+        summary = result.summary()
+        summary["rps"] /= args.workers
+        print_summary(f"{args.label} (per worker)", summary)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1")
+    parser.add_argument("--label", default="/posts/all")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=15.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""
+Микро-бенчмарк извлечения preview из HTML: прежний разбор BeautifulSoup
+по всему телу ответа против потокового MetaExtractor.
+
+Запуск:
+    python -m scripts.benchmarks.preview_parser --repeat 20
+
+Корпус генерируется на лету: страницы разного размера, с длинными <script>
+в <head>, с мета-тегами в конце <head> и в кодировке windows-1251
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable
+
+from bs4 import BeautifulSoup
+
+from app.api.posts.html_meta import MetaExtractor, _sniff_charset
+
+CHUNK_SIZE = 16 * 1024
+MAX_HTML_BYTES = 256 * 1024
+
+
+def _page(
+        head_padding: int = 0,
+        body_size: int = 0,
+        charset: str = "utf-8",
+        description: str = "Описание страницы"
+) -> bytes:
+    script = "<script>var data = '" + "x" * head_padding + "';</script>" if head_padding else ""
+    paragraph = "<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20 + "</p>\n"
+    body = paragraph * (body_size // len(paragraph) + 1) if body_size else ""
+    html = (
+        "<!DOCTYPE html><html><head>"
+        f'<meta charset="{charset}"><title>Page</title>{script}'
+        f'<meta property="og:description" content="{description}">'
+        '<meta name="description" content="fallback">'
+        '<meta property="og:image" content="https://example.com/image.png">'
+        f"</head><body>{body}</body></html>"
+    )
+    return html.encode(charset)
+
+
+CORPUS = {
+    "small (4 KB)": _page(body_size=4 * 1024),
+    "article (300 KB)": _page(head_padding=20 * 1024, body_size=300 * 1024),
+    "heavy head (120 KB)": _page(head_padding=120 * 1024, body_size=200 * 1024),
+    "huge (3 MB)": _page(head_padding=10 * 1024, body_size=3 * 1024 * 1024),
+    "windows-1251 (150 KB)": _page(body_size=150 * 1024, charset="windows-1251"),
+}
+
+
+def parse_with_soup(data: bytes, charset: str) -> tuple[str, str]:
+    """ Прежняя реализация: response.text() и BeautifulSoup по всему документу """
+    soup = BeautifulSoup(data.decode(charset, errors="replace"), "html.parser")
+    content = soup.find("meta", property="og:description")
+    if not content:
+        content = soup.find(attrs={"name": "description"})
+    description = content.get("content", None) if content else "Not found"
+    media_file = soup.find("meta", property="og:image")
+    image = media_file.get("content", None) if media_file else "Not found"
+    return description, image
+
+
+def parse_streaming(data: bytes, charset: str) -> tuple[str, str]:
+    """ Новая реализация: блоки по CHUNK_SIZE до </head> или MAX_HTML_BYTES """
+    extractor = MetaExtractor(max_bytes=MAX_HTML_BYTES, charset=charset)
+    for offset in range(0, len(data), CHUNK_SIZE):
+        if extractor.feed(data[offset:offset + CHUNK_SIZE]):
+            break
+    return extractor.result()
+
+
+def measure(
+        parse: Callable[[bytes, str], tuple[str, str]],
+        data: bytes,
+        charset: str,
+        repeat: int
+) -> tuple[float, int]:
+    """ Среднее время разбора в мс и пиковая память в КБ """
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse(data, charset)
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+    tracemalloc.start()
+    parse(data, charset)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak // 1024
+
+
+def main(repeat: int) -> None:
+    print(f"{'page':<24}{'soup ms':>10}{'stream ms':>11}{'soup KB':>10}{'stream KB':>11}")
+    for name, data in CORPUS.items():
+        # response.text() тоже декодировал по кодировке страницы, обоим разборщикам даётся одна и та же
+        charset = _sniff_charset(data[:CHUNK_SIZE]) or "utf-8"
+        soup_result = parse_with_soup(data, charset)
+        stream_result = parse_streaming(data, charset)
+        assert soup_result == stream_result, f"{name}: {soup_result} != {stream_result}"
+        soup_time, soup_memory = measure(parse_with_soup, data, charset, repeat)
+        stream_time, stream_memory = measure(parse_streaming, data, charset, repeat)
+        print(f"{name:<24}{soup_time:>10.2f}{stream_time:>11.2f}{soup_memory:>10}{stream_memory:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args().repeat)
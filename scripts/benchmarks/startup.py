@@ -0,0 +1,56 @@
+"""
+Холодный старт: время от запуска uvicorn до первого успешного ответа.
+
+Запуск (бд из настроек приложения должна быть доступна):
+    python -m scripts.benchmarks.startup --mode check --workers 4
+    python -m scripts.benchmarks.startup --mode apply --workers 4
+
+mode задаёт MIGRATIONS_ON_STARTUP: apply - каждый воркер применяет миграции
+при старте (прежнее поведение), check - только сверяет версию схемы
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from scripts.benchmarks.common import free_port, percentile, wait_first_response
+
+
+def cold_start(args: argparse.Namespace) -> float:
+    """ Секунды от запуска процесса до первого ответа """
+    port = free_port()
+    env = {**os.environ, "MIGRATIONS_ON_STARTUP": args.mode}
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--port", str(port), "--workers", str(args.workers), "--log-level", "warning",
+        ],
+        env=env,
+    )
+    try:
+        wait_first_response(f"http://127.0.0.1:{port}{args.path}", process, args.timeout)
+        return time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(args: argparse.Namespace) -> None:
+    samples = [cold_start(args) for _ in range(args.repeat)]
+    print(
+        f"mode={args.mode} workers={args.workers} runs={len(samples)} "
+        f"p50={percentile(samples, 50) * 1000:.0f}ms "
+        f"min={min(samples) * 1000:.0f}ms max={max(samples) * 1000:.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["apply", "check", "off"], default="check")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--path", default="/api/v1/posts/all?limit=1")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    main(parser.parse_args())
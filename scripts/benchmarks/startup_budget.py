@@ -0,0 +1,104 @@
+"""
+Бюджет времени старта: импорт app.main по python -X importtime и время
+фабрики get_application(). Завершается с кодом 1, если медиана превышает
+бюджет из startup_budget.json или при импорте загружается модуль,
+который должен импортироваться лениво.
+
+Запуск (нужны переменные окружения настроек приложения, как для uvicorn):
+    python -m scripts.benchmarks.startup_budget
+    python -m scripts.benchmarks.startup_budget --output startup.json
+    python -m scripts.benchmarks.startup_budget --update   # переписать бюджет по текущим замерам
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BUDGET_PATH = Path(__file__).with_name("startup_budget.json")
+
+_FACTORY_CODE = (
+    "import time, app.main\n"
+    "started = time.perf_counter()\n"
+    "app.main.get_application()\n"
+    "print((time.perf_counter() - started) * 1000)\n"
+)
+
+
+def parse_importtime(output: str) -> dict[str, int]:
+    """ Накопленное время импорта в микросекундах по имени модуля """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def measure_import() -> dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True, text=True, check=True
+    )
+    return parse_importtime(result.stderr)
+
+
+def measure_factory() -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", _FACTORY_CODE],
+        capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main(args: argparse.Namespace) -> int:
+    budget = json.loads(BUDGET_PATH.read_text())
+    imports = [measure_import() for _ in range(args.repeat)]
+    import_ms = statistics.median(modules["app.main"] for modules in imports) / 1000
+    factory_ms = statistics.median(measure_factory() for _ in range(args.repeat))
+    loaded = set().union(*imports)
+    eager = sorted(
+        module for module in budget["lazy_modules"]
+        if any(name == module or name.startswith(module + ".") for name in loaded)
+    )
+    slowest = sorted(imports[-1].items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    report = {
+        "import_ms": round(import_ms, 1),
+        "factory_ms": round(factory_ms, 1),
+        "eager_lazy_modules": eager,
+        "slowest_imports_ms": {name: round(us / 1000, 1) for name, us in slowest},
+        "budget": budget,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+    if args.update:
+        budget["import_ms"] = round(import_ms * (1 + args.headroom))
+        budget["factory_ms"] = round(factory_ms * (1 + args.headroom), 1)
+        BUDGET_PATH.write_text(json.dumps(budget, indent=2) + "\n")
+        return 0
+
+    failures = []
+    if import_ms > budget["import_ms"]:
+        failures.append(f"import app.main {import_ms:.0f}ms > budget {budget['import_ms']}ms")
+    if factory_ms > budget["factory_ms"]:
+        failures.append(f"get_application() {factory_ms:.1f}ms > budget {budget['factory_ms']}ms")
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--update", action="store_true", help="rewrite the budget from this run")
+    parser.add_argument("--headroom", type=float, default=0.3)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,42 @@
+"""
+Применение миграций одной командой до запуска воркеров, параметры бд берутся из AppSettings:
+    python -m scripts.migrate            # применить новые миграции
+    python -m scripts.migrate --check    # код возврата 1, если есть неприменённые миграции
+"""
+import argparse
+import asyncio
+import sys
+
+from app.config import AppSettings, get_app_settings
+from app.db.connection import open_dedicated_connection
+from app.db.migrator import apply_migrations, pending_migrations
+from app.logging.logger import setup_logging
+
+
+async def _pending(settings: AppSettings) -> set[str]:
+    conn = await open_dedicated_connection(settings)
+    try:
+        return await pending_migrations(conn)
+    finally:
+        await conn.close()
+
+
+def main(args: argparse.Namespace) -> int:
+    settings = get_app_settings()
+    setup_logging(settings)
+    if args.check:
+        pending = asyncio.run(_pending(settings))
+        for migration_id in sorted(pending):
+            print(f"pending: {migration_id}")
+        return 1 if pending else 0
+    applied = apply_migrations(settings)
+    for migration_id in applied:
+        print(f"applied: {migration_id}")
+    print(f"{len(applied)} migrations applied")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report pending migrations")
+    sys.exit(main(parser.parse_args()))
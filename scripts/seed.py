@@ -0,0 +1,186 @@
+"""
+Заполнение бд синтетическими данными в объёмах прода, параметры бд берутся из AppSettings:
+    python -m scripts.seed --users 100000 --posts 1000000 --likes 10000000
+
+Строки загружаются COPY (copy_records_to_table) в одной транзакции, id заранее
+резервируются в последовательностях таблиц, поэтому данные добавляются к уже
+существующим. У всех пользователей один пароль --password, bcrypt считается один раз.
+
+Распределения степенные: число постов у автора и лайков у поста пропорционально
+1 / rank ** alpha (--author-alpha, --like-alpha, 0 - равномерно), размер описания
+в preview логнормальный со средним --preview-bytes. like_count постов считается
+по тем же лайкам, которые загружаются в like_users, и проверяется после загрузки
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from typing import Iterator
+
+from asyncpg.connection import Connection
+
+from app.api.authentication.hashing import hash_password
+from app.config import get_app_settings
+from app.db.connection import open_dedicated_connection
+
+_WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit")
+
+
+def power_law_weights(count: int, alpha: float, rng: random.Random) -> list[float]:
+    """ Веса 1 / rank ** alpha, перемешанные, чтобы популярность не зависела от id """
+    weights = [1 / (rank ** alpha) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+def distribute(total: int, weights: list[float], cap: int) -> list[int]:
+    """ Делит total пропорционально весам, не больше cap на элемент """
+    counts = [0] * len(weights)
+    order = sorted(range(len(weights)), key=weights.__getitem__, reverse=True)
+    # от тяжёлых к лёгким: то, что не поместилось в cap, делится между оставшимися
+    remaining_total, remaining_weight = total, sum(weights)
+    for index in order:
+        if remaining_weight <= 0:
+            break
+        counts[index] = min(cap, remaining_total, math.floor(weights[index] * remaining_total / remaining_weight))
+        remaining_total -= counts[index]
+        remaining_weight -= weights[index]
+    # остаток от округления раздаётся самым тяжёлым элементам, у которых ещё есть место
+    for index in order:
+        if remaining_total <= 0:
+            break
+        if counts[index] < cap:
+            counts[index] += 1
+            remaining_total -= 1
+    return counts
+
+
+def text(rng: random.Random, size: int) -> str:
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+async def reserve_ids(conn: Connection, table: str, count: int) -> int:
+    """ Резервирует count id в последовательности таблицы и возвращает первый """
+    sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", table)
+    first = await conn.fetchval("SELECT nextval($1::text::regclass)", sequence)
+    await conn.execute("SELECT setval($1::text::regclass, $2)", sequence, first + count - 1)
+    return first
+
+
+def user_records(first_id: int, count: int, hashed_password: str, prefix: str) -> Iterator[tuple]:
+    for user_id in range(first_id, first_id + count):
+        yield user_id, f"{prefix}{user_id}", hashed_password
+
+
+def post_records(
+        first_id: int,
+        authors: list[int],
+        like_counts: list[int],
+        args: argparse.Namespace,
+        rng: random.Random
+) -> Iterator[tuple]:
+    mu = math.log(args.preview_bytes) - 0.5
+    for offset, (author_id, like_count) in enumerate(zip(authors, like_counts)):
+        post_id = first_id + offset
+        if rng.random() < args.link_ratio:
+            link = f"https://example.com/articles/{post_id}"
+            description = text(rng, max(1, round(rng.lognormvariate(mu, 1.0))))
+            preview = {"description": description, "file": "Not found"}
+        else:
+            link = ""
+            preview = {"message": "null"}
+        yield post_id, text(rng, rng.randint(10, 255)), "", link, json.dumps(preview), author_id, like_count
+
+
+def like_records(
+        first_post_id: int,
+        like_counts: list[int],
+        user_ids: range,
+        rng: random.Random
+) -> Iterator[tuple]:
+    for offset, like_count in enumerate(like_counts):
+        post_id = first_post_id + offset
+        for user_id in rng.sample(user_ids, like_count):
+            yield user_id, post_id
+
+
+async def seed(args: argparse.Namespace) -> int:
+    rng = random.Random(args.seed)
+    hashed_password = hash_password(args.password)
+    author_weights = power_law_weights(args.users, args.author_alpha, rng)
+    like_counts = distribute(args.likes, power_law_weights(args.posts, args.like_alpha, rng), cap=args.users)
+
+    conn = await open_dedicated_connection(get_app_settings())
+    try:
+        async with conn.transaction():
+            first_user_id = await reserve_ids(conn, "users", args.users)
+            first_post_id = await reserve_ids(conn, "posts", args.posts)
+            user_ids = range(first_user_id, first_user_id + args.users)
+            authors = rng.choices(user_ids, cum_weights=list(itertools.accumulate(author_weights)), k=args.posts)
+
+            started = time.perf_counter()
+            await conn.copy_records_to_table(
+                "users", columns=("id", "username", "hashed_password"),
+                records=user_records(first_user_id, args.users, hashed_password, args.prefix)
+            )
+            print(f"users:      {args.users:>10} rows in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            await conn.copy_records_to_table(
+                "posts", columns=("id", "text", "files", "link", "preview", "author_id", "like_count"),
+                records=post_records(first_post_id, authors, like_counts, args, rng)
+            )
+            print(f"posts:      {args.posts:>10} rows in {time.perf_counter() - started:.1f}s")
+
+            started = time.perf_counter()
+            await conn.copy_records_to_table(
+                "like_users", columns=("user_id", "post_id"),
+                records=like_records(first_post_id, like_counts, user_ids, rng)
+            )
+            print(f"like_users: {sum(like_counts):>10} rows in {time.perf_counter() - started:.1f}s")
+
+            # like_count записан при загрузке постов, сверка с like_users защищает от расхождений
+            mismatched = await conn.fetchval(
+                """SELECT count(*) FROM posts
+                        LEFT JOIN (SELECT post_id, count(*) AS count FROM like_users
+                                    WHERE post_id BETWEEN $1 AND $2
+                                    GROUP BY post_id) AS likes ON likes.post_id = posts.id
+                        WHERE posts.id BETWEEN $1 AND $2
+                          AND posts.like_count <> coalesce(likes.count, 0)""",
+                first_post_id, first_post_id + args.posts - 1
+            )
+            if mismatched:
+                raise RuntimeError(f"{mismatched} posts have like_count different from like_users")
+        started = time.perf_counter()
+        await conn.execute("ANALYZE users, posts, like_users")
+        print(f"analyze in {time.perf_counter() - started:.1f}s")
+    finally:
+        await conn.close()
+    print(f"users {first_user_id}..{first_user_id + args.users - 1}, "
+          f"posts {first_post_id}..{first_post_id + args.posts - 1}, password {args.password!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--likes", type=int, default=1_000_000)
+    parser.add_argument("--author-alpha", type=float, default=1.0, help="power-law exponent of posts per author")
+    parser.add_argument("--like-alpha", type=float, default=1.0, help="power-law exponent of likes per post")
+    parser.add_argument("--preview-bytes", type=int, default=300, help="mean preview description size")
+    parser.add_argument("--link-ratio", type=float, default=0.5, help="share of posts with a link and preview")
+    parser.add_argument("--prefix", default="seed_user_", help="username prefix, the user id is appended")
+    parser.add_argument("--password", default="seed", help="password of every seeded user")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for reproducible data")
+    sys.exit(asyncio.run(seed(parser.parse_args())))
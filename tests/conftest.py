@@ -0,0 +1,32 @@
+import asyncio
+
+import asyncpg
+import pytest
+from pydantic import ValidationError
+
+from app.config import AppSettings, get_app_settings
+from app.db.connection import open_dedicated_connection
+from app.db.migrator import apply_migrations
+
+
+async def _ping(settings: AppSettings) -> None:
+    conn = await asyncio.wait_for(open_dedicated_connection(settings), timeout=5)
+    await conn.close()
+
+
+@pytest.fixture(scope="session")
+def settings() -> AppSettings:
+    """
+    Настройки бд из переменных окружения, как у приложения. Миграции применяются
+    один раз за прогон, если настройки не заданы или бд недоступна, тесты с бд пропускаются
+    """
+    try:
+        settings = get_app_settings()
+    except ValidationError as e:
+        pytest.skip(f"Настройки приложения не заданы: {e}")
+    try:
+        asyncio.run(_ping(settings))
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+    apply_migrations(settings)
+    return settings
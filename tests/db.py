@@ -0,0 +1,43 @@
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI
+
+from app.config import AppSettings
+from app.db.connection import LazyConnection, close_db_connection, connect_to_db
+from app.db.repositories.post import PostRepository
+from app.db.repositories.user import UserRepository
+from app.db.schemas.post import Post, PostCreate
+from app.db.schemas.user import UserBase, UserCreate
+
+
+@asynccontextmanager
+async def connected_app(settings: AppSettings) -> AsyncIterator[FastAPI]:
+    """ Приложение с открытым пулом бд, как после старта воркера """
+    app = FastAPI()
+    await connect_to_db(app, settings)
+    try:
+        yield app
+    finally:
+        await close_db_connection(app)
+
+
+async def create_users(app: FastAPI, count: int) -> list[UserBase]:
+    """ Пользователи с уникальными именами, чтобы тесты не мешали друг другу """
+    prefix = f"test_{uuid.uuid4().hex[:8]}_"
+    user_repo = UserRepository(LazyConnection(app.state.pool))
+    return [
+        await user_repo.add(UserCreate(username=f"{prefix}{n}", password="not a hash"))
+        for n in range(count)
+    ]
+
+
+async def create_post(app: FastAPI, author: UserBase) -> Post:
+    post_repo = PostRepository(LazyConnection(app.state.pool))
+    return await post_repo.add(PostCreate(text="test post", preview={"message": "null"}), author_id=author.id)
+
+
+async def delete_users(app: FastAPI, users: list[UserBase]) -> None:
+    """ Удаляет пользователей, их посты и лайки удаляются каскадно """
+    await app.state.pool.execute("DELETE FROM users WHERE id = any($1::int[])", [user.id for user in users])
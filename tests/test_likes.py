@@ -0,0 +1,36 @@
+import asyncio
+import random
+
+from app.config import AppSettings
+from app.db.connection import LazyConnection
+from app.db.repositories.post import PostRepository
+from tests.db import connected_app, create_post, create_users, delete_users
+
+USERS = 20
+TOGGLES_PER_USER = 7
+
+
+async def _toggle_concurrently(settings: AppSettings) -> tuple[int, int, int]:
+    async with connected_app(settings) as app:
+        users = await create_users(app, USERS)
+        try:
+            post = await create_post(app, users[0])
+            toggles = [user.id for user in users for _ in range(TOGGLES_PER_USER)]
+            random.Random(0).shuffle(toggles)
+            # у каждой задачи своё соединение, как у отдельных HTTP-запросов
+            await asyncio.gather(*(
+                PostRepository(LazyConnection(app.state.pool)).toggle_like(post_id=post.id, user_id=user_id)
+                for user_id in toggles
+            ))
+            like_count = await app.state.pool.fetchval("SELECT like_count FROM posts WHERE id = $1", post.id)
+            likes = await app.state.pool.fetchval("SELECT count(*) FROM like_users WHERE post_id = $1", post.id)
+        finally:
+            await delete_users(app, users)
+    # нечётное число нажатий оставляет лайк
+    return like_count, likes, USERS if TOGGLES_PER_USER % 2 else 0
+
+
+def test_concurrent_toggle_like_keeps_like_count_consistent(settings: AppSettings) -> None:
+    like_count, likes, expected = asyncio.run(_toggle_concurrently(settings))
+    assert like_count == likes
+    assert likes == expected
@@ -0,0 +1,130 @@
+import uuid
+from typing import Any, Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import AppSettings
+from app.db import connection
+from app.db.schemas.user import UserBase
+from tests.db import delete_users
+
+API = "/api/v1"
+
+
+class StatementLog:
+    """ Имена запросов реестра, выполненных через LazyConnection """
+
+    def __init__(self) -> None:
+        self.names: list[str] = []
+
+    def take(self) -> list[str]:
+        names, self.names = self.names, []
+        return names
+
+
+@pytest.fixture()
+def statements(monkeypatch: pytest.MonkeyPatch) -> StatementLog:
+    log = StatementLog()
+    query = connection._query
+
+    async def logged_query(conn: Any, method: str, *args: Any, **kwargs: Any) -> Any:
+        log.names.append(getattr(args[0], "name", args[0]))
+        return await query(conn, method, *args, **kwargs)
+
+    monkeypatch.setattr(connection, "_query", logged_query)
+    return log
+
+
+@pytest.fixture()
+def client(settings: AppSettings) -> Iterator[TestClient]:
+    # AppSettings() читается при импорте app.main, без переменных окружения тесты пропускаются, а не падают
+    from app.main import get_application
+
+    with TestClient(get_application()) as client:
+        yield client
+
+
+@pytest.fixture()
+def auth_headers(client: TestClient) -> Iterator[dict[str, str]]:
+    credentials = {"username": f"test_{uuid.uuid4().hex[:8]}", "password": "password"}
+    response = client.post(f"{API}/auth/registration", json=credentials)
+    assert response.status_code == 201
+    user = UserBase(**response.json())
+    try:
+        response = client.post(f"{API}/auth/login", json=credentials)
+        yield {"Authorization": f"Bearer {response.json()['access_token']}"}
+    finally:
+        client.portal.call(delete_users, client.app, [user])
+
+
+def create_post(client: TestClient, headers: dict[str, str]) -> int:
+    """ Создаёт пост, заодно пользователь попадает в кэш процесса и дальше не читается из бд """
+    response = client.post(f"{API}/posts/create", data={"text": "test post"}, headers=headers)
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+def test_get_post_reads_post_once(
+        client: TestClient,
+        auth_headers: dict[str, str],
+        statements: StatementLog
+) -> None:
+    post_id = create_post(client, auth_headers)
+    statements.take()
+    assert client.get(f"{API}/posts/{post_id}").status_code == 200
+    assert statements.take() == ["post.get_by_id"]
+    # повторный запрос отдаётся из кэша воркера
+    assert client.get(f"{API}/posts/{post_id}").status_code == 200
+    assert statements.take() == []
+
+
+def test_get_all_posts_reads_page_once(
+        client: TestClient,
+        auth_headers: dict[str, str],
+        statements: StatementLog
+) -> None:
+    for _ in range(3):
+        create_post(client, auth_headers)
+    statements.take()
+    response = client.get(f"{API}/posts/all", params={"limit": 2})
+    assert response.status_code == 200
+    assert statements.take() == ["post.get_page"]
+    next_cursor = response.json()["next_cursor"]
+    assert next_cursor is not None
+    response = client.get(f"{API}/posts/all", params={"limit": 2, "cursor": next_cursor, "direction": "after"})
+    assert response.status_code == 200
+    assert statements.take() == ["post.get_after"]
+
+
+def test_create_post_inserts_once(
+        client: TestClient,
+        auth_headers: dict[str, str],
+        statements: StatementLog
+) -> None:
+    create_post(client, auth_headers)
+    statements.take()
+    create_post(client, auth_headers)
+    assert statements.take() == ["post.add"]
+
+
+def test_like_reads_post_once(
+        client: TestClient,
+        auth_headers: dict[str, str],
+        statements: StatementLog
+) -> None:
+    post_id = create_post(client, auth_headers)
+    statements.take()
+    assert client.post(f"{API}/posts/like/{post_id}", headers=auth_headers).status_code == 201
+    assert statements.take() == ["post.get_by_id", "post.lock_like", "post.toggle_like"]
+
+
+def test_delete_reads_post_once(
+        client: TestClient,
+        auth_headers: dict[str, str],
+        statements: StatementLog
+) -> None:
+    post_id = create_post(client, auth_headers)
+    statements.take()
+    assert client.delete(f"{API}/posts/{post_id}", headers=auth_headers).status_code == 204
+    assert statements.take() == ["post.get_by_id", "post.delete"]
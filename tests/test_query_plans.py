@@ -0,0 +1,130 @@
+"""
+Планы запросов репозиториев на бд с данными: EXPLAIN каждого запроса из реестра
+app.db.statements и запросов каскадного удаления по внешним ключам с настройками
+планировщика по умолчанию. Данные добавляются в транзакции, которая откатывается,
+объёмы подобраны так, чтобы без индекса планировщик выбирал последовательное сканирование
+"""
+import asyncio
+import json
+import uuid
+from typing import Any, Iterator
+
+from asyncpg.connection import Connection
+
+from app.config import AppSettings
+from app.db import statements
+from app.db.connection import open_dedicated_connection
+
+USERS = 10_000
+POSTS = 100_000
+LIKES_PER_POST = 3
+MEDIA = 100_000
+
+# параметры для EXPLAIN каждого запроса реестра, у нового запроса они должны появиться здесь
+SAMPLE_ARGS: dict[str, tuple] = {
+    statements.POST_GET_PAGE.name: (20, 1000),
+    statements.POST_GET_AFTER.name: (1000, 20),
+    statements.POST_GET_BEFORE.name: (1000, 20),
+    statements.POST_GET_BY_ID.name: (1,),
+    statements.POST_GET_USER_LIKE.name: (1, 1),
+    statements.POST_ADD.name: ("text", None, None, None, 1),
+    statements.POST_UPDATE_PREVIEW.name: (1, None),
+    statements.POST_GET_PENDING_PREVIEWS.name: (0, 100),
+    statements.POST_LOCK_LIKE.name: (1, 1),
+    statements.POST_TOGGLE_LIKE.name: (1, 1),
+    statements.POST_INSERT_LIKE.name: (1, 1),
+    statements.POST_DELETE_LIKE.name: (1, 1),
+    statements.POST_INCREMENT_LIKES.name: (1,),
+    statements.POST_DECREMENT_LIKES.name: (1,),
+    statements.POST_DELETE.name: (1,),
+    statements.USER_GET_BY_USERNAME.name: ("username",),
+    statements.USER_GET_BY_ID.name: (1,),
+    statements.USER_ADD.name: ("username", "hashed_password"),
+    statements.MEDIA_ADD_REFERENCE.name: ("0" * 64, "media/path"),
+    statements.MEDIA_RELEASE_REFERENCES.name: (["0" * 64],),
+    statements.MEDIA_DELETE_UNREFERENCED.name: (["0" * 64],),
+    statements.MEDIA_LOCK.name: (["0" * 64],),
+    statements.MEDIA_GET_EXISTING.name: (["0" * 64],),
+}
+
+# запросы, которые postgres выполняет при ON DELETE CASCADE, в EXPLAIN самого DELETE их не видно
+CASCADES: dict[str, tuple[str, tuple]] = {
+    "cascade.posts.like_users": ("DELETE FROM like_users WHERE post_id = $1", (1,)),
+    "cascade.users.posts": ("DELETE FROM posts WHERE author_id = $1", (1,)),
+    "cascade.users.like_users": ("DELETE FROM like_users WHERE user_id = $1", (1,)),
+}
+
+
+async def seed(conn: Connection) -> None:
+    """ Пользователи, посты, лайки и media в объёмах, при которых важны индексы """
+    prefix = f"plan_{uuid.uuid4().hex[:8]}_"
+    first_user = await conn.fetchval(
+        """WITH inserted AS (
+                INSERT INTO users (username, hashed_password)
+                SELECT $1::text || g, 'hashed_password' FROM generate_series(1, $2) AS g
+                RETURNING id
+            ) SELECT min(id) FROM inserted""",
+        prefix, USERS)
+    first_post = await conn.fetchval(
+        """WITH inserted AS (
+                INSERT INTO posts (text, files, link, preview, author_id)
+                SELECT 'text', '', '', '{"message": "null"}', $1 + g % $3 FROM generate_series(1, $2) AS g
+                RETURNING id
+            ) SELECT min(id) FROM inserted""",
+        first_user, POSTS, USERS)
+    await conn.execute(
+        """INSERT INTO like_users (user_id, post_id)
+            SELECT $1 + (g * 7 + n) % $3, $2 + g
+            FROM generate_series(0, $4 - 1) AS g, generate_series(1, $5) AS n""",
+        first_user, first_post, USERS, POSTS, LIKES_PER_POST)
+    await conn.execute(
+        """INSERT INTO media (hash, path, ref_count)
+            SELECT md5($1::text || g) || md5(g::text), 'media/' || g, 1 FROM generate_series(1, $2) AS g""",
+        prefix, MEDIA)
+    await conn.execute("ANALYZE users, posts, like_users, media")
+
+
+def plan_nodes(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    """ Все узлы дерева плана, включая подпланы и CTE """
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def seq_scans(plan: dict[str, Any]) -> list[str]:
+    """ Таблицы, которые план читает последовательным сканированием """
+    return [node["Relation Name"] for node in plan_nodes(plan) if node["Node Type"] == "Seq Scan"]
+
+
+async def explain(conn: Connection, sql: str, args: tuple) -> dict[str, Any]:
+    # EXPLAIN без ANALYZE запрос не выполняет
+    result = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    return json.loads(result)[0]["Plan"]
+
+
+async def _seq_scans_by_query(settings: AppSettings) -> dict[str, list[str]]:
+    queries = {statement.name: (statement, SAMPLE_ARGS[statement.name]) for statement in statements.registry}
+    queries.update(CASCADES)
+    conn = await open_dedicated_connection(settings)
+    try:
+        transaction = conn.transaction()
+        await transaction.start()
+        try:
+            await seed(conn)
+            return {
+                name: scanned
+                for name, (sql, args) in queries.items()
+                if (scanned := seq_scans(await explain(conn, sql, args)))
+            }
+        finally:
+            await transaction.rollback()
+    finally:
+        await conn.close()
+
+
+def test_every_statement_has_sample_args() -> None:
+    assert {statement.name for statement in statements.registry} <= SAMPLE_ARGS.keys()
+
+
+def test_query_plans_use_indexes(settings: AppSettings) -> None:
+    assert asyncio.run(_seq_scans_by_query(settings)) == {}